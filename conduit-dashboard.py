@@ -11,64 +11,487 @@ import json
 import threading
 import time
 import base64
-from datetime import datetime, timedelta
+import hashlib
+import gzip
+import os
+import atexit
+import calendar
+import tempfile
+import shutil
+import socket
+import shlex
+from collections import deque
+from itertools import takewhile
+from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# orjson is optional: several times faster and returns bytes directly.
+# ujson is the next best thing when only it is installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# brotli is optional too: used to pre-compress the page and API payloads
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 SCRIPT_DIR = Path(__file__).parent
 CONFIG_FILE = SCRIPT_DIR / "conduit-vps.conf"
-HISTORY_FILE = SCRIPT_DIR / "conduit-history.json"
+HISTORY_FILE = SCRIPT_DIR / "conduit-history.jsonl"  # one data point per line
+LEGACY_HISTORY_FILE = SCRIPT_DIR / "conduit-history.json"  # pre-JSONL format
+DOCKER_PREFIX_FILE = SCRIPT_DIR / ".docker_prefix.json"
+DOCKER_PREFIX_SCHEMA = 1  # bump to invalidate saved strategies
+DOCKER_PREFIX_TTL = 7 * 86400  # re-probe saved strategies after a week
+SNOWFLAKE_FILE = SCRIPT_DIR / ".snowflake_clients.json"
+SNOWFLAKE_SAVE_INTERVAL = 300  # seconds between saves of the snowflake totals
 PORT = 5050
 REFRESH_INTERVAL = 15  # seconds
 SSH_TIMEOUT = 15 # seconds
+SSH_PROBE_TIMEOUT = 45  # seconds for the whole batched probe script of one VPS
 SSH_CONNECT_TIMEOUT = 10
+SSH_RETRY_CONNECT_TIMEOUT = 3  # connect timeout when re-probing a VPS that was offline
+SSH_MASTER_RETRY = 5  # seconds a failed master connect is reused as the verdict
 SSH_Server_Alive_Interval = 30
+SSH_CONTROL_PERSIST = 600  # seconds an idle multiplexed master stays alive
 HISTORY_DAYS = 2  # Keep 2 days of history
+HISTORY_MAX_POINTS = HISTORY_DAYS * 86400 // REFRESH_INTERVAL + 64
+HISTORY_COMPACT_INTERVAL = 3600  # seconds between rewrites of the history file
+HISTORY_RANGES = {"1h": 1, "6h": 6, "24h": 24, "48h": 48}  # chart range -> hours
+HISTORY_MAX_SAMPLES = 500  # points sent per chart range; the chart is ~1000px wide
+MAX_PARALLEL_VPS = 32  # upper bound on VPS probed concurrently
+OFFLINE_BACKOFF_MAX = 300  # longest wait (seconds) before re-probing an offline VPS
+CONDUIT_LOG_TAIL = 1000  # log lines a first probe searches for the last [STATS]
+TOR_LOG_TAIL = 5000  # log lines a first probe searches for the last bootstrap line
+STREAM_KEEPALIVE = 30  # seconds between comments on an idle /api/stream
+STREAM_HISTORY_RESYNC = 40  # /api/stream resends the whole range every this many events
+BROTLI_PAYLOAD_QUALITY = 5  # brotli level for API payloads (the page itself uses 11)
 
 # Service names we track
 SERVICES = ["conduit", "conduit2", "snowflake", "tor-bridge"]
+# Conduit containers, in instance order, with the probe section holding their [STATS] line
+CONDUITS = (("conduit", "conduit_stats"), ("conduit2", "conduit2_stats"))
+
+# Parsers for probe output, compiled once instead of on every refresh
+PROBE_SECTION_RE = re.compile(r'^===SECTION:(\w+)===$')
+# [STATS] Connecting: 17 | Connected: 226 | Up: 7.1 GB | Down: 74.1 GB | Uptime: 3h47m8s
+# The whole line in one scan; the per-field parsers below are the fallback
+# for lines that don't follow this layout
+RE_STATS_LINE = re.compile(
+    r'Connecting:\s*(?P<connecting>\d+)\s*\|\s*Connected:\s*(?P<connections>\d+)'
+    r'\s*\|\s*Up:\s*(?P<up>[\d.]+)\s*(?P<up_unit>GB|MB|KB)'
+    r'\s*\|\s*Down:\s*(?P<down>[\d.]+)\s*(?P<down_unit>GB|MB|KB)'
+)
+RE_CONNECTING = re.compile(r'Connecting:\s*(\d+)')
+RE_CONNECTED = re.compile(r'Connected:\s*(\d+)')
+RE_UP = re.compile(r'Up:\s*([\d.]+)\s*(GB|MB|KB)')
+RE_DOWN = re.compile(r'Down:\s*([\d.]+)\s*(GB|MB|KB)')
+RE_BOOTSTRAP = re.compile(r'Bootstrapped (\d+)%')
+RE_MEM = re.compile(r'([\d.]+)\s*(KiB|MiB|GiB|KB|MB|GB)')
+# Multipliers for the units those parsers capture
+UNIT_GB = {"KB": 1 / 1024 / 1024, "MB": 1 / 1024, "GB": 1.0}
+UNIT_MB = {"KiB": 1 / 1024, "KB": 1 / 1024, "MiB": 1.0, "MB": 1.0, "GiB": 1024.0, "GB": 1024.0}
+
+# Global stats storage. "version" goes up by one per collection so clients
+# can ask for just the changes since the snapshot they already have; it starts
+# at the launch time so versions seen before a restart never match again.
+current_stats = {"vps": [], "timestamp": "", "conduits": [], "version": int(time.time())}
+
+
+def json_bytes(obj):
+    """Compact JSON encoding of obj as UTF-8 bytes."""
+    if orjson:
+        return orjson.dumps(obj)
+    if ujson:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def json_parse(data):
+    """Parse JSON from str or bytes (raises ValueError on bad input)."""
+    if orjson:
+        return orjson.loads(data)
+    return ujson.loads(data) if ujson else json.loads(data)
+
+
+def encode_payload(obj):
+    """JSON-encode a response body once, with its gzip variant and ETag."""
+    return body_payload(json_bytes(obj))
+
+
+def body_payload(body):
+    """Wrap an already-encoded body with its gzip (and brotli) variants and ETag."""
+    return {
+        "body": body,
+        "gzip": gzip.compress(body),
+        # Built once per collection but sent to every client: a mid quality
+        # already beats gzip on the repetitive JSON at a fraction of q11's cost
+        "br": brotli.compress(body, quality=BROTLI_PAYLOAD_QUALITY) if brotli else None,
+        "etag": '"' + hashlib.md5(body).hexdigest() + '"',
+    }
+
+
+def diff_stats(prev_vps, cur_vps):
+    """Per-VPS changes between two collections, keyed by alias."""
+    prev_by_alias = {s["alias"]: s for s in prev_vps}
+    cur_aliases = {s["alias"] for s in cur_vps}
+    changed, added = [], []
+    for s in cur_vps:
+        old = prev_by_alias.get(s["alias"])
+        if old is None:
+            added.append(s)
+            continue
+        fields = {k: v for k, v in s.items() if old.get(k) != v}
+        fields.update({k: None for k in old if k not in s})
+        if fields:
+            changed.append({"alias": s["alias"], "fields": fields})
+    removed = [alias for alias in prev_by_alias if alias not in cur_aliases]
+    return changed, added, removed
+
+
+def serialize_stats(delta=None):
+    """
+    Encode current_stats once per collection; requests just send the bytes.
+    Three variants: the full snapshot, the delta from the previous version
+    (for clients holding exactly that version) and "unchanged" (for clients
+    already on the current version).
+    """
+    version = current_stats["version"]
+    return {
+        "version": version,
+        "full": encode_payload(current_stats),
+        "delta": encode_payload(dict(delta, version=version, base=version - 1)) if delta else None,
+        "same": encode_payload({"version": version, "base": version}),
+    }
 
-# Global stats storage
-current_stats = {"vps": [], "timestamp": "", "conduits": []}
-stats_lock = threading.Lock()
+
+# Pre-serialized /api/stats responses, rebuilt whenever current_stats changes.
+# Replaced with a single assignment, so readers need no lock. stats_changed is
+# notified after each swap to wake /api/stream clients.
+stats_payload = serialize_stats()
+stats_changed = threading.Condition()
+
+
+def get_stats_variant(since, payload=None):
+    """Pick the encoded stats for a client holding version `since` (a string)."""
+    payload = payload or stats_payload
+    if since == str(payload["version"]):
+        return payload["same"]
+    if since == str(payload["version"] - 1) and payload["delta"]:
+        return payload["delta"]
+    return payload["full"]
+
+# Connection history: the in-memory ring buffer is the source of truth, the
+# JSONL file is an append-only log of it that survives restarts
+history_buf = deque(maxlen=HISTORY_MAX_POINTS)
+# "payloads" caches encoded /api/history responses per range, and the
+# /api/snapshot bodies built from them; it is replaced with a fresh dict
+# whenever the buffer changes, i.e. once per collection. "delta_since" is the newest
+# ts before the last append, the one `since` every up-to-date client sends.
+history_state = {"vps_names": [], "last_compact": 0.0, "payloads": {}, "delta_since": None}
+history_lock = threading.Lock()
+
+# Parsed conduit-vps.conf, re-read only when the file's mtime or size changes
+config_cache = {"mtime": None, "value": None}
+config_lock = threading.Lock()
 
 # Docker execution strategy cache per VPS:
 # "" (plain docker) or "sudo -n " or "echo 'pass' | sudo -S -p '' "
 docker_prefix_cache = {}
 docker_prefix_lock = threading.Lock()
+# Strategy names ("plain", "sudo", "sudo_pw") persisted in DOCKER_PREFIX_FILE
+docker_prefix_saved = {}
 
 # VPS static hardware cache per VPS (cores, total RAM in MB)
 vps_hw_cache = {}
 vps_hw_lock = threading.Lock()
 
+# Unreachable VPS: {key: {"next_probe": monotonic time, "backoff": seconds}}.
+# Until next_probe they are reported offline without spending an SSH attempt.
+offline_state = {}
+offline_lock = threading.Lock()
+
+# Container log polling state per VPS: the remote clock at the previous probe
+# (so the next one only reads newer log lines), the last interesting line
+# seen per log section, reused while a window contains nothing new, and the
+# running total of snowflake client connections with the remote time it
+# counts up to
+log_state = {}
+log_state_lock = threading.Lock()
+# Snowflake totals from earlier runs ({key: {"since": ts, "total": n}}), so a
+# restart only counts the log written since the last save, not all of it
+snowflake_saved = {}
+snowflake_state = {"last_save": 0.0}
+
+# Probe sections that report the latest matching log line
+LAST_LINE_SECTIONS = ("conduit_stats", "conduit2_stats", "torbridge_bootstrap")
+
+# SSH connection multiplexing: one ControlMaster socket per VPS lives here.
+# Only the master authenticates (sshpass included); every other command
+# attaches to the existing transport instead of doing a fresh handshake.
+SSH_CM_DIR = Path(tempfile.mkdtemp(prefix="conduit-cm-"))
+ssh_master_cache = {}  # key -> True once the master is up
+ssh_master_failed = {}  # key -> monotonic time of the last failed master connect
+ssh_master_locks = {}  # key -> Lock, so only one thread starts a master
+ssh_master_lock = threading.Lock()
+
 def load_history():
-    """Load connection history from JSON file."""
-    if HISTORY_FILE.exists():
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                return json.load(f)
-        except:
-            pass
-    return {"data": [], "vps_names": []}
+    """
+    Fill the in-memory history buffer from the JSONL log on startup.
+    Points are parsed and filtered one line at a time, so expired points are
+    never held in memory. The log is only rewritten if something in it was
+    dropped or upgraded.
+    """
+    cutoff_ts = history_cutoff()
+    compact = True  # no log yet (or only the legacy file): write a fresh one
+    with history_lock:
+        history_buf.clear()
+        if HISTORY_FILE.exists():
+            compact = False
+            with open(HISTORY_FILE, "rb") as f:
+                for line in f:
+                    try:
+                        point = json_parse(line)
+                        if not isinstance(point, dict):
+                            raise ValueError("not a history point")
+                        if "ts" not in point:
+                            compact = True  # old "time" format
+                        point = upgrade_history_point(point)
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        compact = True
+                        continue  # torn last line after a crash, or a stray value
+                    if point["ts"] < cutoff_ts or len(history_buf) == history_buf.maxlen:
+                        compact = True
+                    if not line.endswith(b"\n"):
+                        compact = True  # the next append would land on this line
+                    if point["ts"] >= cutoff_ts:
+                        history_buf.append(point)
+        elif LEGACY_HISTORY_FILE.exists():
+            try:
+                with open(LEGACY_HISTORY_FILE, "r") as f:
+                    legacy = json.load(f).get("data", [])
+                legacy = (upgrade_history_point(d) for d in legacy)
+                history_buf.extend(d for d in legacy if d["ts"] >= cutoff_ts)
+            except:
+                pass
+        history_state["vps_names"] = list(history_buf[-1]["connections"]) if history_buf else []
+        history_state["payloads"] = {}
+    if compact:
+        save_history()
+    else:
+        history_state["last_compact"] = time.time()
+
 
+def upgrade_history_point(point):
+    """
+    Convert a point written with a "YYYY-mm-dd HH:MM:SS" time to epoch "ts",
+    and fill in the "total" that points written before it was stored lack.
+    """
+    if "ts" not in point:
+        point["ts"] = int(datetime.strptime(point.pop("time"), "%Y-%m-%d %H:%M:%S").timestamp())
+    if "total" not in point:
+        point["total"] = sum(v or 0 for v in point["connections"].values())
+    return point
+
+
+def get_history():
+    """Snapshot of the history in the shape the dashboard expects."""
+    with history_lock:
+        return {"data": list(history_buf), "vps_names": list(history_state["vps_names"])}
+
+
+def get_history_after(since):
+    """Points newer than epoch second `since`, walking back from the newest one."""
+    with history_lock:
+        points = list(takewhile(lambda d: d["ts"] > since, reversed(history_buf)))
+        vps_names = list(history_state["vps_names"])
+    points.reverse()
+    return points, vps_names
+
+
+def downsample_lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keep `threshold` points that preserve the
+    visual shape of the total-connections line. Whole points are kept, so the
+    result has the same format as the input.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+    xs = [p["ts"] for p in points]
+    ys = [p["total"] for p in points]
+    sampled = [points[0]]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        nxt_start = int((i + 1) * bucket) + 1
+        nxt_end = min(int((i + 2) * bucket) + 1, n)
+        avg_x = sum(xs[nxt_start:nxt_end]) / (nxt_end - nxt_start)
+        avg_y = sum(ys[nxt_start:nxt_end]) / (nxt_end - nxt_start)
 
-def save_history(history):
-    """Save connection history to JSON file."""
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
 
 
-def cleanup_old_history(history):
-    """Remove data points older than HISTORY_DAYS."""
-    cutoff = datetime.now() - timedelta(days=HISTORY_DAYS)
-    cutoff_str = cutoff.strftime("%Y-%m-%d %H:%M:%S")
-    history["data"] = [d for d in history["data"] if d["time"] >= cutoff_str]
-    return history
+def get_history_range(range_key, since=None):
+    """
+    History for one chart range, downsampled to HISTORY_MAX_SAMPLES points.
+    The chart only plots the total, so a range comes back as two parallel
+    integer columns, "ts" and "total", rather than per-conduit points.
+    Without a known range the full per-conduit history is returned.
+
+    With `since` (epoch seconds, the last "ts" a client already has) only the
+    newer points come back, unsampled, for the client to append.
+    """
+    hours = HISTORY_RANGES.get(range_key)
+    if since is not None:
+        points, vps_names = get_history_after(since)
+        if hours is None:
+            return {"since": since, "data": points, "vps_names": vps_names}
+        return {
+            "since": since,
+            "ts": [d["ts"] for d in points],
+            "total": [d["total"] for d in points],
+        }
+    if hours is None:
+        return get_history()
+    # The buffer is in time order, so the range is a suffix of it: only the
+    # points inside it are visited, not the whole two days
+    cutoff_ts = int(time.time()) - hours * 3600
+    points, vps_names = get_history_after(cutoff_ts - 1)
+    sampled = downsample_lttb(points, HISTORY_MAX_SAMPLES)
+    return {
+        "vps_names": vps_names,
+        "ts": [d["ts"] for d in sampled],
+        "total": [d["total"] for d in sampled],
+    }
+
+
+def get_history_payload(range_key, since=None):
+    """
+    Encoded history for one chart range, built at most once per data point.
+    "last_ts" is the newest point it covers, the `since` for the next request,
+    and doubles as the payload's Last-Modified time.
+    """
+    if range_key not in HISTORY_RANGES:
+        range_key = None
+    # Same read-copy-update as stats_payload: writers swap in a new dict, so
+    # reading the current one needs no lock
+    cache = history_state["payloads"]
+    # Only the full range and the one shared delta are worth keeping; any
+    # other `since` is client-specific and would grow the dict without bound
+    cacheable = since is None or since == history_state["delta_since"]
+    payload = cache.get((range_key, since)) if cacheable else None
+    if payload is None:
+        history = get_history_range(range_key, since)
+        ts = history["ts"] if "ts" in history else [d["ts"] for d in history["data"][-1:]]
+        payload = encode_payload(history)
+        payload["last_ts"] = ts[-1] if ts else since
+        if payload["last_ts"]:
+            payload["last_modified"] = payload["last_ts"]
+        # If a point arrives meanwhile, this lands in the discarded dict
+        if cacheable:
+            cache[(range_key, since)] = payload
+    return payload
+
+
+def get_snapshot_payload(since, range_key, current=None, history_since=None):
+    """
+    Stats and history in one response, spliced from the cached encodings.
+    Cached by the ETags of its two parts in the per-collection history_state
+    dict, so a new collection drops the old multi-megabyte bodies with it.
+    """
+    cache = history_state["payloads"]
+    # Same rule as get_history_payload: client-specific `since` isn't kept
+    cacheable = history_since is None or history_since == history_state["delta_since"]
+    stats = get_stats_variant(since, current)
+    history = get_history_payload(range_key, history_since)
+    key = ("snapshot", stats["etag"], history["etag"])
+    payload = cache.get(key) if cacheable else None
+    if payload is None:
+        body = b'{"stats":' + stats["body"] + b',"history":' + history["body"] + b'}'
+        payload = body_payload(body)
+        payload["last_ts"] = history["last_ts"]
+        if cacheable:
+            cache[key] = payload
+    return payload
+
+
+def append_history(point, vps_names):
+    """
+    Record one data point: O(1) append to the buffer and the JSONL log.
+    Only the collector thread writes the log, so file I/O happens outside
+    history_lock and requests never wait on the disk.
+    """
+    with history_lock:
+        history_state["delta_since"] = history_buf[-1]["ts"] if history_buf else None
+        history_buf.append(point)
+        trim_history()
+        history_state["vps_names"] = vps_names
+        history_state["payloads"] = {}
+        compact_due = time.time() - history_state["last_compact"] >= HISTORY_COMPACT_INTERVAL
+
+    if compact_due:
+        save_history()
+    else:
+        with open(HISTORY_FILE, "ab") as f:
+            f.write(json_bytes(point) + b"\n")
+
+
+def save_history():
+    """Compact the JSONL log: rewrite it from the buffer, dropping expired points."""
+    with history_lock:
+        trim_history()
+        points = list(history_buf)
+    tmp = HISTORY_FILE.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        for point in points:
+            f.write(json_bytes(point) + b"\n")
+    os.replace(tmp, HISTORY_FILE)
+    history_state["last_compact"] = time.time()
+
+
+def history_cutoff():
+    """Oldest epoch second still inside the HISTORY_DAYS retention window."""
+    return int(time.time()) - HISTORY_DAYS * 86400
+
+
+def trim_history():
+    """Pop points older than HISTORY_DAYS off the front (caller holds history_lock)."""
+    cutoff_ts = history_cutoff()
+    while history_buf and history_buf[0]["ts"] < cutoff_ts:
+        history_buf.popleft()
 
 
 def parse_config():
-    """Parse VPS config file."""
+    """Parse VPS config file (cached until the file changes on disk)."""
+    # ns mtime plus size, so a quick edit within one coarse mtime tick still counts
+    st = CONFIG_FILE.stat()
+    mtime = (st.st_mtime_ns, st.st_size)
+    with config_lock:
+        if config_cache["mtime"] == mtime:
+            return config_cache["value"]
+
     vps_list = []
     with open(CONFIG_FILE, "r") as f:
         for line in f:
@@ -77,14 +500,22 @@ def parse_config():
                 continue
             parts = line.split("|")
             if len(parts) >= 5:
-                vps_list.append({
+                vps = {
                     "alias": parts[0].strip(),
                     "user": parts[1].strip(),
                     "ip": parts[2].strip(),
                     "port": parts[3].strip() or "22",
                     "password": parts[4].strip(),
                     "comment": parts[5].strip() if len(parts) > 5 else "",
-                })
+                }
+                # Derived once per config load instead of on every lookup
+                vps["key"] = _vps_key(vps)
+                vps["ip_masked"] = mask_ip(vps["ip"])
+                vps_list.append(vps)
+
+    with config_lock:
+        config_cache["mtime"] = mtime
+        config_cache["value"] = vps_list
     return vps_list
 
 
@@ -96,27 +527,241 @@ def mask_ip(ip):
     return "***.***.***.***"
 
 
-def ssh_command(vps, cmd):
-    """Execute SSH command on VPS."""
-    ssh_opts = f"-o StrictHostKeyChecking=no -o ConnectTimeout={SSH_CONNECT_TIMEOUT} -o ServerAliveInterval={SSH_Server_Alive_Interval}"
-    
-    if vps["password"] and vps["password"] != "-":
-        full_cmd = f"sshpass -p '{vps['password']}' ssh {ssh_opts} -p {vps['port']} {vps['user']}@{vps['ip']} \"{cmd}\""
+def _is_local(vps):
+    return vps["ip"] in ("127.0.0.1", "LOCAL", "Local", "local")
+
+
+def _ssh_opts(connect_timeout=SSH_CONNECT_TIMEOUT):
+    """Common ssh options, including the ControlMaster socket path."""
+    return [
+        "-o", "StrictHostKeyChecking=no",
+        "-o", f"ConnectTimeout={connect_timeout}",
+        "-o", f"ServerAliveInterval={SSH_Server_Alive_Interval}",
+        # %C is a fixed-length hash of user/host/port, so long hostnames
+        # can't push the socket path past the unix socket length limit
+        "-o", f"ControlPath={SSH_CM_DIR}/%C",
+    ]
+
+
+def ssh_master_alive(vps):
+    """Ask the local ControlMaster socket whether its master is still running."""
+    try:
+        result = subprocess.run(
+            ["ssh", "-O", "check", *_ssh_opts(), "-p", vps["port"], f"{vps['user']}@{vps['ip']}"],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=5,
+        )
+    except:
+        return False
+    return result.returncode == 0
+
+
+def ensure_ssh_master(vps):
+    """
+    Start a background ControlMaster for this VPS if one isn't running yet.
+    Returns True if a master is available to attach to.
+
+    A cached master is checked with `ssh -O check` first: if it died, a
+    ControlMaster=no client would quietly fall back to a full handshake on
+    every call, so the entry is dropped and a new master started.
+
+    A failed connect is remembered for SSH_MASTER_RETRY seconds, so the other
+    calls of the same refresh (docker strategy probe, main probe) don't each
+    wait out the timeout again. A VPS that was offline last time is retried
+    with the shorter SSH_RETRY_CONNECT_TIMEOUT.
+    """
+    key = vps["key"]
+    with ssh_master_lock:
+        cached = ssh_master_cache.get(key)
+        lock = ssh_master_locks.setdefault(key, threading.Lock())
+    if cached:
+        if ssh_master_alive(vps):
+            return True
+        print(f"SSH master for {vps['alias']} is gone, reconnecting")
+        with ssh_master_lock:
+            ssh_master_cache.pop(key, None)
+
+    with lock:
+        if ssh_master_cache.get(key):
+            return True
+        failed = ssh_master_failed.get(key)
+        if failed and time.monotonic() - failed < SSH_MASTER_RETRY:
+            return False
+        with offline_lock:
+            was_offline = key in offline_state
+        connect_timeout = SSH_RETRY_CONNECT_TIMEOUT if was_offline else SSH_CONNECT_TIMEOUT
+
+        argv = [
+            "ssh", "-M", "-N", "-f",
+            "-o", "ControlMaster=yes",
+            "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+            *_ssh_opts(connect_timeout),
+            "-p", vps["port"], f"{vps['user']}@{vps['ip']}",
+        ]
+        password = None
+        if vps["password"] and vps["password"] != "-":
+            # Password goes in over stdin so it never shows up in /proc/*/cmdline
+            argv = ["sshpass", "-f", "/dev/stdin", *argv]
+            password = vps["password"] + "\n"
+
+        # The backgrounded master must not inherit our pipes, otherwise
+        # subprocess.run would wait on it until the timeout fires.
+        try:
+            result = subprocess.run(
+                argv,
+                input=password.encode() if password else None,
+                stdin=None if password else subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=SSH_TIMEOUT,
+            )
+            ok = result.returncode == 0
+        except:
+            ok = False
+
+        with ssh_master_lock:
+            ssh_master_cache[key] = ok
+            if ok:
+                ssh_master_failed.pop(key, None)
+            else:
+                ssh_master_failed[key] = time.monotonic()
+        return ok
+
+
+def close_ssh_masters():
+    """Ask every multiplexed master to exit and remove the socket directory
+    (registered with atexit)."""
+    with ssh_master_lock:
+        keys = [k for k, ok in ssh_master_cache.items() if ok]
+        ssh_master_cache.clear()
+    for key in keys:
+        user_host, port = key.rsplit(":", 1)
+        try:
+            subprocess.run(
+                ["ssh", "-O", "exit", *_ssh_opts(), "-p", port, user_host],
+                capture_output=True, timeout=5,
+            )
+        except:
+            pass
+    shutil.rmtree(SSH_CM_DIR, ignore_errors=True)
+
+
+atexit.register(close_ssh_masters)
+
+
+def ssh_command(vps, cmd, stdin=None, timeout=SSH_TIMEOUT, partial=False):
+    """Execute SSH command on VPS over its multiplexed connection.
+
+    `cmd` is either a shell command line or an argv list; a local VPS runs an
+    argv list directly, without a shell in between.
+    `stdin` (optional) is fed to the remote command, e.g. a script for "sh -s".
+    Returns None if the VPS couldn't be reached. With `partial`, a command
+    that runs past `timeout` returns what it printed so far instead, since
+    the host did answer.
+    """
+    if _is_local(vps):
+        argv = ["sh", "-c", cmd] if isinstance(cmd, str) else list(cmd)
     else:
-        full_cmd = f"ssh {ssh_opts} -p {vps['port']} {vps['user']}@{vps['ip']} \"{cmd}\""
+        if not ensure_ssh_master(vps):
+            return None
+        if not isinstance(cmd, str):
+            cmd = shlex.join(cmd)  # the remote side always goes through a shell
+        argv = [
+            "ssh", "-o", "ControlMaster=no", "-o", "BatchMode=yes", *_ssh_opts(),
+            "-p", vps["port"], f"{vps['user']}@{vps['ip']}", cmd,
+        ]
 
-    if vps["ip"] in ("127.0.0.1", "LOCAL", "Local", "local"):
-        full_cmd = cmd
-    
     try:
-        result = subprocess.run(full_cmd, shell=True, capture_output=True, text=True, timeout=SSH_TIMEOUT)
-        return result.stdout.strip()
+        result = subprocess.run(
+            argv, input=stdin, capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired as e:
+        if not partial:
+            return None
+        # On POSIX the output so far is attached as bytes, text=True or not
+        out = e.stdout or ""
+        return (out.decode(errors="replace") if isinstance(out, bytes) else out).strip()
     except:
         return None
 
-def _sh_single_quote(s: str) -> str:
-    """Safely single-quote a string for /bin/sh."""
-    return "'" + s.replace("'", "'\"'\"'") + "'"
+    if result.returncode == 255 and not _is_local(vps):
+        # ssh itself failed (master gone, network drop): rebuild next time
+        with ssh_master_lock:
+            ssh_master_cache.pop(vps["key"], None)
+        return None
+    return result.stdout.strip()
+
+
+def _docker_prefix_for(vps, strategy):
+    """Turn a stored strategy name back into a command prefix (None if unusable)."""
+    if strategy == "plain":
+        return ""
+    if strategy == "sudo":
+        return "sudo -n "
+    if strategy == "sudo_pw" and vps.get("password") and vps["password"] != "-":
+        return f"echo {shlex.quote(vps['password'])} | sudo -S -p '' "
+    return None
+
+
+def load_docker_prefixes():
+    """Load docker strategies discovered by earlier runs."""
+    try:
+        with open(DOCKER_PREFIX_FILE, "rb") as f:
+            saved = json_parse(f.read())
+    except:
+        return
+    if saved.get("version") != DOCKER_PREFIX_SCHEMA:
+        return
+    with docker_prefix_lock:
+        docker_prefix_saved.update(saved.get("entries", {}))
+
+
+def save_docker_prefixes():
+    """Write the known docker strategies to disk (atomically)."""
+    with docker_prefix_lock:
+        data = {"version": DOCKER_PREFIX_SCHEMA, "entries": dict(docker_prefix_saved)}
+    tmp = DOCKER_PREFIX_FILE.with_suffix(".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(json_bytes(data))
+        os.replace(tmp, DOCKER_PREFIX_FILE)
+    except OSError as e:
+        print(f"Could not save {DOCKER_PREFIX_FILE.name}: {e}")
+
+
+def load_snowflake_totals():
+    """Load the snowflake client totals saved by an earlier run."""
+    try:
+        with open(SNOWFLAKE_FILE, "rb") as f:
+            saved = json_parse(f.read())
+    except:
+        return
+    if not isinstance(saved, dict):
+        return
+    with log_state_lock:
+        snowflake_saved.update(saved)
+    snowflake_state["last_save"] = time.time()
+
+
+def save_snowflake_totals(force=False):
+    """
+    Write every VPS's snowflake total and window end to disk (atomically),
+    at most once per SNOWFLAKE_SAVE_INTERVAL unless forced.
+    """
+    if not force and time.time() - snowflake_state["last_save"] < SNOWFLAKE_SAVE_INTERVAL:
+        return
+    snowflake_state["last_save"] = time.time()
+    with log_state_lock:
+        data = dict(snowflake_saved)
+        data.update({
+            key: {"since": state["snowflake_since"], "total": state["snowflake_total"]}
+            for key, state in log_state.items() if state["snowflake_since"]
+        })
+    tmp = SNOWFLAKE_FILE.with_suffix(".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(json_bytes(data))
+        os.replace(tmp, SNOWFLAKE_FILE)
+    except OSError as e:
+        print(f"Could not save {SNOWFLAKE_FILE.name}: {e}")
 
 
 def get_docker_prefix(vps):
@@ -125,36 +770,54 @@ def get_docker_prefix(vps):
     1) docker ...
     2) sudo -n docker ...
     3) echo <pass> | sudo -S -p '' docker ...
-    Cached per VPS so we probe only once.
+    Cached per VPS so we probe only once, and remembered across restarts
+    (for DOCKER_PREFIX_TTL) in DOCKER_PREFIX_FILE.
     """
-    key = f"{vps.get('user')}@{vps.get('ip')}:{vps.get('port')}"
+    key = vps["key"]
     with docker_prefix_lock:
         if key in docker_prefix_cache:
             return docker_prefix_cache[key]
+        saved = docker_prefix_saved.get(key)
+
+    if saved and time.time() - saved.get("ts", 0) < DOCKER_PREFIX_TTL:
+        prefix = _docker_prefix_for(vps, saved.get("strategy"))
+        if prefix is not None:
+            with docker_prefix_lock:
+                docker_prefix_cache[key] = prefix
+            return prefix
 
     # 1) plain docker
+    strategy = None
     probe = ssh_command(vps, "docker info >/dev/null 2>&1 && echo OK || echo FAIL")
-    if probe and probe.strip() == "OK":
-        prefix = ""
+    if probe is None:
+        # Unreachable: fall back to plain docker for now and probe again next time
+        return ""
+    if probe.strip() == "OK":
+        strategy = "plain"
     else:
         # 2) passwordless sudo (non-interactive)
         probe2 = ssh_command(vps, "sudo -n docker info >/dev/null 2>&1 && echo OK || echo FAIL")
         if probe2 and probe2.strip() == "OK":
-            prefix = "sudo -n "
+            strategy = "sudo"
         else:
             # 3) sudo with password over stdin (only if we have a password in config)
-            prefix = ""
-            if vps.get("password") and vps["password"] != "-":
-                pw = _sh_single_quote(vps["password"])
+            prefix = _docker_prefix_for(vps, "sudo_pw")
+            if prefix is not None:
                 probe3 = ssh_command(
                     vps,
-                    f"echo {pw} | sudo -S -p '' docker info >/dev/null 2>&1 && echo OK || echo FAIL"
+                    f"{prefix}docker info >/dev/null 2>&1 && echo OK || echo FAIL"
                 )
                 if probe3 and probe3.strip() == "OK":
-                    prefix = f"echo {pw} | sudo -S -p '' "
+                    strategy = "sudo_pw"
 
+    prefix = _docker_prefix_for(vps, strategy) or ""
     with docker_prefix_lock:
         docker_prefix_cache[key] = prefix
+        if strategy:
+            # Only the strategy name is stored, never the password itself
+            docker_prefix_saved[key] = {"strategy": strategy, "ts": time.time()}
+    if strategy:
+        save_docker_prefixes()
     return prefix
 
 
@@ -164,25 +827,30 @@ def docker_command(vps, docker_args):
     return ssh_command(vps, f"{prefix}docker {docker_args}")
 
 def _vps_key(vps) -> str:
-    """Stable cache key for a VPS."""
+    """Stable cache key for a VPS (stored as vps["key"] by parse_config)."""
     return f"{vps.get('user')}@{vps.get('ip')}:{vps.get('port')}"
 
-def get_vps_hardware(vps):
+def has_vps_hardware(vps):
+    """True once get_vps_hardware has cached this VPS."""
+    with vps_hw_lock:
+        return vps["key"] in vps_hw_cache
+
+
+def get_vps_hardware(vps, sections):
     """
     Get VPS static hardware info once (per VPS) and cache it:
       - cpu_cores (int)
       - mem_total_mb (float)
+    Until it is cached, the probe script carries the hardware sections too
+    (see build_probe_script), so this costs no extra round trip.
     """
-    key = _vps_key(vps)
+    key = vps["key"]
     with vps_hw_lock:
         if key in vps_hw_cache:
             return vps_hw_cache[key]["cpu_cores"], vps_hw_cache[key]["mem_total_mb"]
 
     # CPU cores
-    cores_out = ssh_command(
-        vps,
-        "nproc 2>/dev/null || getconf _NPROCESSORS_ONLN 2>/dev/null || grep -c '^processor' /proc/cpuinfo 2>/dev/null"
-    )
+    cores_out = sections.get("cpu_cores")
     try:
         cpu_cores = int((cores_out or "").strip())
         if cpu_cores <= 0:
@@ -190,12 +858,14 @@ def get_vps_hardware(vps):
     except:
         cpu_cores = 1
 
-    # Total RAM (kB from /proc/meminfo)
-    mem_kb_out = ssh_command(vps, "grep -i '^MemTotal:' /proc/meminfo 2>/dev/null | awk '{print $2}'")
+    # Total RAM: the "MemTotal:   <kB> kB" line of /proc/meminfo, found by
+    # label since line order isn't guaranteed
+    mem_total_kb = 0.0
     try:
-        s = (mem_kb_out or "").strip()
-        m = re.search(r'(\d+(?:\.\d+)?)', s)
-        mem_total_kb = float(m.group(1)) if m else 0.0
+        for line in (sections.get("meminfo") or "").splitlines():
+            if line.startswith("MemTotal:"):
+                mem_total_kb = float(line.split()[1])
+                break
         mem_total_mb = mem_total_kb / 1024.0
         if mem_total_mb <= 0:
             mem_total_mb = 0.0
@@ -207,31 +877,186 @@ def get_vps_hardware(vps):
 
     return cpu_cores, mem_total_mb
 
+
+def build_probe_script(vps, since=None, hardware=False, snowflake_since=None):
+    """
+    Build one shell script that runs every per-refresh probe for a VPS.
+    Each block's output is preceded by a ===SECTION:<name>=== marker line
+    so split_sections() can take the combined output apart again.
+    The body is one { ... } group, so the shell has read the whole script
+    before anything runs and no probe can swallow the rest of stdin.
+
+    The probes run concurrently into a temp dir, so the docker CLI start-ups
+    (and the ~1s sample that `docker stats --no-stream` takes) overlap instead
+    of adding up. Each section is printed as soon as its probe has finished,
+    quick ones first, and a final "end" marker closes the output: a probe cut
+    off by SSH_PROBE_TIMEOUT still returns every section it completed.
+
+    `since` is a remote Unix timestamp from the previous probe; when given,
+    container logs are only read from that point on instead of from the start.
+    Snowflake lines are counted over the exact window (snowflake_since, now]
+    so the per-probe counts can be summed into a running total; that window
+    has its own start because it carries over from the previous run.
+
+    `hardware` adds the static core count / RAM probes for get_vps_hardware.
+    """
+    docker = f"{get_docker_prefix(vps)}docker"
+    logs = f"{docker} logs --since {since}" if since else f"{docker} logs"
+    # Conduit prints [STATS] regularly, so a first probe only needs the tail;
+    # tor-bridge's log is read to the end on long-lived bridges otherwise
+    stats_logs = logs if since else f"{logs} --tail {CONDUIT_LOG_TAIL}"
+    tor_logs = logs if since else f"{logs} --tail {TOR_LOG_TAIL}"
+    if snowflake_since:
+        snowflake_logs = f"{docker} logs --since {snowflake_since}.000000001"
+    else:
+        snowflake_logs = f"{docker} logs"
+    probes = [
+        ("uptime", "uptime -p 2>/dev/null || uptime | awk '{print $3,$4}'"),
+        # State and UTC start time of just the tracked containers, one JSON
+        # object per line; missing ones only complain on stderr
+        ("containers", docker + " inspect --format "
+                       "'{\"name\":{{json .Name}},\"state\":{{json .State.Status}},\"started\":{{json .State.StartedAt}}}' "
+                       + " ".join(SERVICES)),
+    ]
+    if hardware:
+        probes += [
+            ("cpu_cores", "nproc 2>/dev/null || getconf _NPROCESSORS_ONLN 2>/dev/null || grep -c '^processor' /proc/cpuinfo 2>/dev/null"),
+            ("meminfo", "cat /proc/meminfo"),
+        ]
+    # Log scans last: on a first probe they are what can run long
+    probes += [
+        ("conduit_stats", stats_logs + " conduit 2>&1 | grep '\\[STATS\\]' | tail -1"),
+        ("conduit2_stats", stats_logs + " conduit2 2>&1 | grep '\\[STATS\\]' | tail -1"),
+        # docker stats samples for a second or two; skip it when conduit isn't running
+        ("docker_stats", docker + " inspect -f '{{.State.Running}}' conduit 2>/dev/null | grep -q true"
+                         " && " + docker + " stats conduit --no-stream --format '{{json .}}'"),
+        ("torbridge_bootstrap", tor_logs + " tor-bridge 2>&1 | grep -i 'bootstrap' | tail -1"),
+        ("snowflake_clients", snowflake_logs + " --until \"$now\" snowflake 2>&1 | grep -c 'client connected'"),
+    ]
+    # No temp dir, no probe: an empty $out would write into /. The traps also
+    # clean up after a probe whose session went away on the timeout.
+    lines = [
+        "{", "now=$(date +%s)", "out=$(mktemp -d) || exit 1",
+        "trap 'rm -rf \"$out\"' EXIT", "trap 'exit 1' HUP INT TERM PIPE",
+        "echo '===SECTION:now==='", "echo \"$now\"",
+    ]
+    for i, (name, cmd) in enumerate(probes):
+        lines += [f"( {cmd} ) >\"$out/{name}\" 2>/dev/null &", f"p{i}=$!"]
+    for i, (name, _) in enumerate(probes):
+        # Marker before the wait, so a cut-off output ends in the unfinished section
+        lines += [f"echo '===SECTION:{name}==='", f"wait $p{i}", f"cat \"$out/{name}\""]
+    lines += ["echo '===SECTION:end==='", "}", ""]
+    return "\n".join(lines)
+
+
+def split_sections(output):
+    """Split probe script output into {section_name: text}."""
+    sections = {}
+    current = None
+    for line in output.split('\n'):
+        m = PROBE_SECTION_RE.match(line)
+        if m:
+            current = m.group(1)
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return {name: "\n".join(lines).strip() for name, lines in sections.items()}
+
+
+def human_duration(seconds):
+    """Format a duration the way docker ps does ("Up 3 hours", "Up 2 days")."""
+    seconds = int(seconds)
+    if seconds < 1:
+        return "Less than a second"
+    if seconds == 1:
+        return "1 second"
+    if seconds < 60:
+        return f"{seconds} seconds"
+    minutes = seconds // 60
+    if minutes == 1:
+        return "About a minute"
+    if minutes < 60:
+        return f"{minutes} minutes"
+    hours = int(seconds / 3600 + 0.5)
+    if hours == 1:
+        return "About an hour"
+    if hours < 48:
+        return f"{hours} hours"
+    if hours < 24 * 7 * 2:
+        return f"{hours // 24} days"
+    if hours < 24 * 30 * 2:
+        return f"{hours // 24 // 7} weeks"
+    if hours < 24 * 365 * 2:
+        return f"{hours // 24 // 30} months"
+    return f"{seconds // (365 * 86400)} years"
+
+
+def container_uptime(started_at, now):
+    """Uptime text for a container started at RFC 3339 UTC time `started_at`."""
+    try:
+        # "2026-01-28T14:40:12.345678901Z": whole seconds are plenty
+        started = calendar.timegm(time.strptime(started_at[:19], "%Y-%m-%dT%H:%M:%S"))
+    except ValueError:
+        return "N/A"
+    return human_duration(max(0, now - started))
+
+
+def format_traffic(val, unit):
+    """Convert a [STATS] Up/Down value to (GB for totals, display text)."""
+    return val * UNIT_GB[unit], f"{val:.1f} {unit}"
+
+
+def parse_conduit_stats(conduit, line):
+    """Fill the connection and traffic fields of one conduit from its [STATS] log line."""
+    m = RE_STATS_LINE.search(line)
+    if m:
+        conduit["connecting"] = int(m["connecting"])
+        conduit["connections"] = int(m["connections"])
+        for direction in ("up", "down"):
+            gb, text = format_traffic(float(m[direction]), m[direction + "_unit"])
+            conduit[f"{direction}_gb"] = gb
+            conduit[direction] = text
+        return
+
+    connecting_match = RE_CONNECTING.search(line)
+    if connecting_match:
+        conduit["connecting"] = int(connecting_match.group(1))
+
+    connected_match = RE_CONNECTED.search(line)
+    if connected_match:
+        conduit["connections"] = int(connected_match.group(1))
+
+    for direction, regex in (("up", RE_UP), ("down", RE_DOWN)):
+        match = regex.search(line)
+        if match:
+            gb, text = format_traffic(float(match.group(1)), match.group(2))
+            conduit[f"{direction}_gb"] = gb
+            conduit[direction] = text
+
+
 def get_vps_stats(vps):
     """Collect all stats from a single VPS."""
     stats = {
         "alias": vps["alias"],
         "ip": vps["ip"],
+        "ip_masked": vps["ip_masked"],
         "comment": vps["comment"],
         "online": False,
-        # Conduit 1 stats
-        "conduit_running": False,
-        "conduit_uptime": "N/A",
-        "connections": 0,
-        "connecting": 0,
-        "conduit_up": "N/A",
-        "conduit_down": "N/A",
-        "conduit_up_gb": 0,
-        "conduit_down_gb": 0,
-        # Conduit 2 stats
-        "conduit2_running": False,
-        "conduit2_uptime": "N/A",
-        "connections2": 0,
-        "connecting2": 0,
-        "conduit2_up": "N/A",
-        "conduit2_down": "N/A",
-        "conduit2_up_gb": 0,
-        "conduit2_down_gb": 0,
+        # Conduit stats, one entry per instance in CONDUITS order
+        "conduits": [
+            {
+                "instance": instance,
+                "running": False,
+                "uptime": "N/A",
+                "connections": 0,
+                "connecting": 0,
+                "up": "N/A",
+                "down": "N/A",
+                "up_gb": 0,
+                "down_gb": 0,
+            }
+            for instance in range(1, len(CONDUITS) + 1)
+        ],
         # Snowflake stats
         "snowflake_running": False,
         "snowflake_uptime": "N/A",
@@ -247,46 +1072,92 @@ def get_vps_stats(vps):
         "uptime": "N/A",
     }
     
-    # Check if online
-    uptime = ssh_command(vps, "uptime -p 2>/dev/null || uptime | awk '{print $3,$4}'")
-    if uptime is None:
+    key = vps["key"]
+    with offline_lock:
+        offline = offline_state.get(key)
+        if offline and time.monotonic() < offline["next_probe"]:
+            return stats
+    with log_state_lock:
+        state = log_state.get(key)
+        if state is None:
+            saved = snowflake_saved.get(key) or {}
+            state = log_state[key] = {
+                "since": None,
+                "lines": {},
+                "snowflake_since": saved.get("since"),
+                "snowflake_total": saved.get("total", 0),
+            }
+
+    # Every per-refresh probe goes out as one script over one SSH round-trip
+    script = build_probe_script(
+        vps, state["since"], hardware=not has_vps_hardware(vps),
+        snowflake_since=state["snowflake_since"],
+    )
+    output = ssh_command(vps, ["sh", "-s"], stdin=script, timeout=SSH_PROBE_TIMEOUT, partial=True)
+    if output is None:
+        # Couldn't connect at all (a probe that only ran long still returns
+        # its output): back off exponentially so a dead host doesn't stretch
+        # every refresh
+        with offline_lock:
+            backoff = min(OFFLINE_BACKOFF_MAX, offline["backoff"] * 2 if offline else REFRESH_INTERVAL)
+            offline_state[key] = {"next_probe": time.monotonic() + backoff, "backoff": backoff}
         return stats
-    
+    with offline_lock:
+        offline_state.pop(key, None)
+    sections = split_sections(output)
+    complete = sections.pop("end", None) is not None
+    if not complete:
+        # Cut off by the timeout: the host is up, but the last section is the
+        # probe it was still waiting on, so only the ones before it are kept
+        if sections:
+            sections.popitem()
+        print(f"Probe of {vps['alias']} timed out, showing partial stats")
+
+    # Log sections only cover lines written since the previous probe; keep
+    # showing the last line seen when nothing new was logged in between
+    with log_state_lock:
+        for name in LAST_LINE_SECTIONS:
+            if sections.get(name):
+                state["lines"][name] = sections[name]
+            else:
+                sections[name] = state["lines"].get(name, "")
+        # A cut-off probe didn't read every log up to "now"; the next one
+        # starts from the same point again
+        if complete and sections.get("now", "").isdigit():
+            state["since"] = int(sections["now"])
+            # Count only advances together with the window it was taken over
+            if sections.get("snowflake_clients", "").isdigit():
+                state["snowflake_total"] += int(sections["snowflake_clients"])
+                state["snowflake_since"] = state["since"]
+        sections["snowflake_clients"] = str(state["snowflake_total"])
+
     stats["online"] = True
-    stats["uptime"] = uptime.replace("up ", "")
+    stats["uptime"] = sections.get("uptime", "").replace("up ", "") or "N/A"
 
     # Static hardware info (cached once per VPS)
-    cpu_cores, mem_total_mb = get_vps_hardware(vps)
+    cpu_cores, mem_total_mb = get_vps_hardware(vps, sections)
     # Optional: keep these in stats for debugging/visibility (UI can ignore them safely)
     stats["cpu_cores"] = cpu_cores
     stats["memory_total_mb"] = mem_total_mb
 
-    # Check all container statuses in one command
-    container_info = docker_command(
-        vps,
-        "ps -a --format '{{.Names}}|{{.Status}}' 2>/dev/null"
-    )
+    # Container statuses; uptimes are measured against the remote clock
+    container_info = sections.get("containers")
+    conduits = {name: conduit for (name, _), conduit in zip(CONDUITS, stats["conduits"])}
+    remote_now = int(sections["now"]) if sections.get("now", "").isdigit() else time.time()
     
     if container_info:
         for line in container_info.split('\n'):
-            if '|' not in line:
+            try:
+                container = json_parse(line)
+                name = container["name"].lstrip('/')
+                is_up = container["state"] == "running"
+            except (ValueError, TypeError, KeyError, AttributeError):
                 continue
-            name, status = line.split('|', 1)
-            is_up = status.startswith('Up')
+            uptime_str = container_uptime(container.get("started", ""), remote_now) if is_up else "N/A"
             
-            # Parse uptime from status like "Up 3 hours" or "Up 2 days"
-            uptime_str = "N/A"
-            if is_up:
-                uptime_match = re.search(r'Up\s+(.+?)(?:\s+\(|$)', status)
-                if uptime_match:
-                    uptime_str = uptime_match.group(1).strip()
-            
-            if name == "conduit":
-                stats["conduit_running"] = is_up
-                stats["conduit_uptime"] = uptime_str
-            elif name == "conduit2":
-                stats["conduit2_running"] = is_up
-                stats["conduit2_uptime"] = uptime_str
+            if name in conduits:
+                conduits[name]["running"] = is_up
+                conduits[name]["uptime"] = uptime_str
             elif name == "snowflake":
                 stats["snowflake_running"] = is_up
                 stats["snowflake_uptime"] = uptime_str
@@ -294,96 +1165,14 @@ def get_vps_stats(vps):
                 stats["torbridge_running"] = is_up
                 stats["torbridge_uptime"] = uptime_str
     
-    # Get Conduit connection count from [STATS] log line
-    if stats["conduit_running"]:
-        stats_line = docker_command(vps, "logs conduit 2>&1 | grep '\\[STATS\\]' | tail -1")
-        if stats_line:
-            # Parse: [STATS] Connecting: 17 | Connected: 226 | Up: 7.1 GB | Down: 74.1 GB | Uptime: 3h47m8s
-            
-            connecting_match = re.search(r'Connecting:\s*(\d+)', stats_line)
-            if connecting_match:
-                stats["connecting"] = int(connecting_match.group(1))
-            
-            connected_match = re.search(r'Connected:\s*(\d+)', stats_line)
-            if connected_match:
-                stats["connections"] = int(connected_match.group(1))
-            
-            up_match = re.search(r'Up:\s*([\d.]+)\s*(GB|MB|KB)', stats_line)
-            if up_match:
-                val = float(up_match.group(1))
-                unit = up_match.group(2)
-                # Convert to GB for totals
-                if unit == "KB":
-                    stats["conduit_up_gb"] = val / 1024 / 1024
-                    stats["conduit_up"] = f"{val:.1f} KB"
-                elif unit == "MB":
-                    stats["conduit_up_gb"] = val / 1024
-                    stats["conduit_up"] = f"{val:.1f} MB"
-                else:
-                    stats["conduit_up_gb"] = val
-                    stats["conduit_up"] = f"{val:.1f} GB"
-            
-            down_match = re.search(r'Down:\s*([\d.]+)\s*(GB|MB|KB)', stats_line)
-            if down_match:
-                val = float(down_match.group(1))
-                unit = down_match.group(2)
-                # Convert to GB for totals
-                if unit == "KB":
-                    stats["conduit_down_gb"] = val / 1024 / 1024
-                    stats["conduit_down"] = f"{val:.1f} KB"
-                elif unit == "MB":
-                    stats["conduit_down_gb"] = val / 1024
-                    stats["conduit_down"] = f"{val:.1f} MB"
-                else:
-                    stats["conduit_down_gb"] = val
-                    stats["conduit_down"] = f"{val:.1f} GB"
-    
-    # Get Conduit2 connection count from [STATS] log line
-    if stats["conduit2_running"]:
-        stats_line2 = docker_command(vps, "logs conduit2 2>&1 | grep '\\[STATS\\]' | tail -1")
-        if stats_line2:
-            connecting_match2 = re.search(r'Connecting:\s*(\d+)', stats_line2)
-            if connecting_match2:
-                stats["connecting2"] = int(connecting_match2.group(1))
-            
-            connected_match2 = re.search(r'Connected:\s*(\d+)', stats_line2)
-            if connected_match2:
-                stats["connections2"] = int(connected_match2.group(1))
-            
-            up_match2 = re.search(r'Up:\s*([\d.]+)\s*(GB|MB|KB)', stats_line2)
-            if up_match2:
-                val = float(up_match2.group(1))
-                unit = up_match2.group(2)
-                if unit == "KB":
-                    stats["conduit2_up_gb"] = val / 1024 / 1024
-                    stats["conduit2_up"] = f"{val:.1f} KB"
-                elif unit == "MB":
-                    stats["conduit2_up_gb"] = val / 1024
-                    stats["conduit2_up"] = f"{val:.1f} MB"
-                else:
-                    stats["conduit2_up_gb"] = val
-                    stats["conduit2_up"] = f"{val:.1f} GB"
-            
-            down_match2 = re.search(r'Down:\s*([\d.]+)\s*(GB|MB|KB)', stats_line2)
-            if down_match2:
-                val = float(down_match2.group(1))
-                unit = down_match2.group(2)
-                if unit == "KB":
-                    stats["conduit2_down_gb"] = val / 1024 / 1024
-                    stats["conduit2_down"] = f"{val:.1f} KB"
-                elif unit == "MB":
-                    stats["conduit2_down_gb"] = val / 1024
-                    stats["conduit2_down"] = f"{val:.1f} MB"
-                else:
-                    stats["conduit2_down_gb"] = val
-                    stats["conduit2_down"] = f"{val:.1f} GB"
+    # Get Conduit / Conduit2 connection counts from their [STATS] log lines
+    for (_, section), conduit in zip(CONDUITS, stats["conduits"]):
+        if conduit["running"] and sections.get(section):
+            parse_conduit_stats(conduit, sections[section])
     
     # Get Snowflake client count from logs
     if stats["snowflake_running"]:
-        snowflake_log = docker_command(
-            vps,
-            "logs snowflake 2>&1 | grep -c 'client connected' 2>/dev/null || echo 0"
-        )
+        snowflake_log = sections.get("snowflake_clients")
         if snowflake_log:
             try:
                 stats["snowflake_clients"] = int(snowflake_log.strip())
@@ -392,139 +1181,150 @@ def get_vps_stats(vps):
     
     # Get Tor Bridge bootstrap status
     if stats["torbridge_running"]:
-        tor_log = docker_command(vps, "logs tor-bridge 2>&1 | grep -i 'bootstrap' | tail -1")
+        tor_log = sections.get("torbridge_bootstrap")
 
         if tor_log:
-            bootstrap_match = re.search(r'Bootstrapped (\d+)%', tor_log)
+            bootstrap_match = RE_BOOTSTRAP.search(tor_log)
             if bootstrap_match:
                 stats["torbridge_bootstrap"] = int(bootstrap_match.group(1))
     
-    # Get docker stats for CPU/Memory
-    docker_stats = docker_command(
-        vps,
-        "stats conduit --no-stream --format '{{.CPUPerc}}|{{.MemUsage}}' 2>/dev/null"
-    )
+    # Get docker stats for CPU/Memory (nothing meaningful unless conduit runs)
+    # One {{json .}} row: {"CPUPerc": "1.23%", "MemUsage": "238MiB / 7.57GiB", ...}
+    docker_stats = sections.get("docker_stats") if conduits["conduit"]["running"] else None
+    try:
+        row = json_parse(docker_stats) if docker_stats else None
+    except ValueError:
+        row = None
 
-    if docker_stats:
-        parts = docker_stats.split("|")
-        if len(parts) >= 2:
-            # CPU: normalize Docker CPU% to 0-100 by dividing by VPS core count
-            try:
-                raw_cpu = float(parts[0].replace("%", "").strip())
-                cores = stats.get("cpu_cores") or 1
-                stats["cpu_percent"] = raw_cpu / float(cores) if cores else raw_cpu
-                if stats["cpu_percent"] < 0:
-                    stats["cpu_percent"] = 0
-            except:
-                pass
+    if isinstance(row, dict):
+        # CPU: normalize Docker CPU% to 0-100 by dividing by VPS core count
+        try:
+            raw_cpu = float(row["CPUPerc"].replace("%", "").strip())
+            cores = stats.get("cpu_cores") or 1
+            stats["cpu_percent"] = raw_cpu / float(cores) if cores else raw_cpu
+            if stats["cpu_percent"] < 0:
+                stats["cpu_percent"] = 0
+        except:
+            pass
 
-            # Memory: take container used memory, compute % of total VPS RAM
-            # docker MemUsage usually looks like: "238MiB / 7.57GiB"
-            mem_match = re.search(r'([\d.]+)\s*(KiB|MiB|GiB|KB|MB|GB)', parts[1])
-            if mem_match:
-                mem_val = float(mem_match.group(1))
-                unit = mem_match.group(2)
-
-                # Convert to MB
-                if unit in ("KiB", "KB"):
-                    used_mb = mem_val / 1024.0
-                elif unit in ("GiB", "GB"):
-                    used_mb = mem_val * 1024.0
-                else:
-                    used_mb = mem_val  # MiB or MB
-
-                stats["memory_mb"] = round(used_mb, 1)
-
-                total_mb = float(stats.get("memory_total_mb") or 0.0)
-                if total_mb > 0:
-                    pct = (used_mb / total_mb) * 100.0
-                    if pct < 0:
-                        pct = 0.0
-                    if pct > 100:
-                        pct = 100.0
-                    stats["memory_percent"] = pct
+        # Memory: take container used memory, compute % of total VPS RAM
+        # docker MemUsage usually looks like: "238MiB / 7.57GiB"
+        mem_match = RE_MEM.search(str(row.get("MemUsage", "")))
+        if mem_match:
+            used_mb = float(mem_match.group(1)) * UNIT_MB[mem_match.group(2)]
+            stats["memory_mb"] = round(used_mb, 1)
+
+            total_mb = float(stats.get("memory_total_mb") or 0.0)
+            if total_mb > 0:
+                pct = (used_mb / total_mb) * 100.0
+                if pct < 0:
+                    pct = 0.0
+                if pct > 100:
+                    pct = 100.0
+                stats["memory_percent"] = pct
     
     return stats
 
 
+# Probe workers, kept across refreshes; the pool only grows threads as needed
+vps_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_VPS, thread_name_prefix="vps")
+# Held for the duration of a collection; a second caller skips instead of
+# queueing a duplicate round of probes behind it
+collect_lock = threading.Lock()
+
+
 def collect_stats():
-    """Collect stats from all VPS."""
-    global current_stats
+    """Collect stats from all VPS (returns False if a collection was already running)."""
+    if not collect_lock.acquire(blocking=False):
+        return False
+    try:
+        _collect_stats()
+    finally:
+        collect_lock.release()
+    return True
+
+
+def _collect_stats():
+    global current_stats, stats_payload
     vps_list = parse_config()
-    all_stats = []
-    
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(get_vps_stats, vps): vps for vps in vps_list}
-        for future in as_completed(futures):
-            all_stats.append(future.result())
     
+    # One worker per VPS so a refresh takes as long as the slowest host,
+    # not ceil(N / workers) rounds of them
+    all_stats = list(vps_executor.map(get_vps_stats, vps_list))
     all_stats.sort(key=lambda x: x["alias"])
     
     now = datetime.now()
     timestamp = now.strftime("%H:%M:%S")
-    full_timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
     
     # Build conduits list (each conduit instance tracked separately)
-    conduits_list = []
-    for s in all_stats:
-        if s["conduit_running"]:
-            conduits_list.append({
-                "name": f"{s['alias']}-c1",
-                "vps": s["alias"],
-                "instance": 1,
-                "connections": s["connections"],
-                "connecting": s["connecting"],
-                "up_gb": s["conduit_up_gb"],
-                "down_gb": s["conduit_down_gb"],
-            })
-        if s["conduit2_running"]:
-            conduits_list.append({
-                "name": f"{s['alias']}-c2",
-                "vps": s["alias"],
-                "instance": 2,
-                "connections": s["connections2"],
-                "connecting": s["connecting2"],
-                "up_gb": s["conduit2_up_gb"],
-                "down_gb": s["conduit2_down_gb"],
-            })
-    
-    with stats_lock:
-        current_stats["vps"] = all_stats
-        current_stats["timestamp"] = timestamp
-        current_stats["conduits"] = conduits_list
+    conduits_list = [
+        {
+            "name": f"{s['alias']}-c{c['instance']}",
+            "vps": s["alias"],
+            "instance": c["instance"],
+            "connections": c["connections"],
+            "connecting": c["connecting"],
+            "up_gb": c["up_gb"],
+            "down_gb": c["down_gb"],
+        }
+        for s in all_stats
+        for c in s["conduits"]
+        if c["running"]
+    ]
     
-    # Update history file
-    history = load_history()
-    history = cleanup_old_history(history)
+    # current_stats is only touched by this thread; requests read the encoded
+    # payload, which is published in one assignment once history is updated too
+    changed, added, removed = diff_stats(current_stats["vps"], all_stats)
+    delta = {"timestamp": timestamp, "changed": changed, "added": added, "removed": removed}
+    if conduits_list != current_stats["conduits"]:
+        delta["conduits"] = conduits_list
+    current_stats["vps"] = all_stats
+    current_stats["timestamp"] = timestamp
+    current_stats["conduits"] = conduits_list
+    current_stats["version"] += 1
+    payload = serialize_stats(delta)
     
     # Add new data point - track all conduit instances separately
     connections_data = {}
     for s in all_stats:
-        connections_data[f"{s['alias']}-c1"] = s["connections"]
-        connections_data[f"{s['alias']}-c2"] = s["connections2"]
+        for c in s["conduits"]:
+            connections_data[f"{s['alias']}-c{c['instance']}"] = c["connections"]
     
-    history["data"].append({
-        "time": full_timestamp,
-        "connections": connections_data
-    })
     # Track conduit names (34 instances: 17 VPS x 2 conduits)
-    history["vps_names"] = [f"{s['alias']}-c1" for s in all_stats] + [f"{s['alias']}-c2" for s in all_stats]
+    vps_names = [f"{s['alias']}-c{i}" for i in range(1, len(CONDUITS) + 1) for s in all_stats]
+    # The chart only plots the total, so it is summed once here, not per request
+    total_conn = sum(connections_data.values())
+    # A full or read-only disk must not hold back live stats: the point is in
+    # the in-memory buffer before the log write that could fail
+    try:
+        append_history({"ts": int(now.timestamp()), "connections": connections_data, "total": total_conn}, vps_names)
+    except OSError as e:
+        print(f"Could not write {HISTORY_FILE.name}: {e}")
+    save_snowflake_totals()  # logs its own write errors
     
-    save_history(history)
+    with stats_changed:
+        stats_payload = payload
+        stats_changed.notify_all()
     
-    total_conn = sum(s["connections"] + s["connections2"] for s in all_stats)
     total_conduits = len(conduits_list)
     print(f"[{timestamp}] Stats updated: {len(all_stats)} VPS, {total_conduits} conduits, {total_conn} total connections")
 
 
 def stats_collector_loop():
-    """Background thread to collect stats periodically."""
+    """
+    Background thread to collect stats periodically. Collections start every
+    REFRESH_INTERVAL seconds on the monotonic clock, so the period doesn't
+    stretch by however long the SSH round trips took; a collection that
+    overruns is followed by the next one straight away.
+    """
+    next_run = time.monotonic()
     while True:
         try:
             collect_stats()
         except Exception as e:
             print(f"Error collecting stats: {e}")
-        time.sleep(REFRESH_INTERVAL)
+        next_run = max(next_run + REFRESH_INTERVAL, time.monotonic())
+        time.sleep(max(0, next_run - time.monotonic()))
 
 
 HTML_TEMPLATE = '''<!DOCTYPE html>
@@ -705,6 +1505,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         .service-title { font-size: 0.85rem; color: #00d9ff; margin-bottom: 8px; font-weight: 600; }
         
         .vps-footer { font-size: 0.8rem; color: #666; padding-top: 12px; border-top: 1px solid rgba(255,255,255,0.05); }
+        [hidden] { display: none !important; }
     </style>
 </head>
 <body>
@@ -745,11 +1546,96 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         <div class="vps-grid" id="vpsGrid"></div>
     </div>
     
+    <!-- One VPS card; cloned once per VPS and then only patched through its data-f slots -->
+    <template id="tpl-vps-card">
+        <div class="vps-card">
+            <div class="vps-header">
+                <span class="vps-name" data-f="alias"></span>
+                <span class="vps-status" data-f="status"></span>
+            </div>
+            <div class="vps-ip" data-f="ip"></div>
+            
+            <div class="services-row">
+                <span class="service-badge" data-f="c1_badge_class"><span class="dot"></span>C1</span>
+                <span class="service-badge" data-f="c2_badge_class"><span class="dot"></span>C2</span>
+                <span class="service-badge" data-f="sf_badge_class"><span class="dot"></span>SF</span>
+                <span class="service-badge" data-f="tor_badge_class"><span class="dot"></span>Tor</span>
+            </div>
+            
+            <div class="service-section" data-f="conduits_hidden">
+                <div class="service-title">🚀 Conduit Instances</div>
+                <div style="margin-bottom:8px;padding:8px;background:rgba(0,217,255,0.1);border-radius:6px;" data-f="c1_hidden">
+                    <div style="font-size:0.75rem;color:#00d9ff;margin-bottom:4px;" data-f="c1_uptime"></div>
+                    <div class="stat-row">
+                        <span class="stat-label">Connected / Connecting</span>
+                        <span class="stat-value highlight"><span data-f="c1_conn"></span> <span style="color:#ffa502;font-size:0.9rem" data-f="c1_connecting"></span></span>
+                    </div>
+                    <div class="stat-row">
+                        <span class="stat-label">↑↓ Traffic</span>
+                        <span class="stat-value" data-f="c1_traffic"></span>
+                    </div>
+                </div>
+                <div style="padding:8px;background:rgba(0,255,136,0.1);border-radius:6px;" data-f="c2_hidden">
+                    <div style="font-size:0.75rem;color:#00ff88;margin-bottom:4px;" data-f="c2_uptime"></div>
+                    <div class="stat-row">
+                        <span class="stat-label">Connected / Connecting</span>
+                        <span class="stat-value highlight"><span data-f="c2_conn"></span> <span style="color:#ffa502;font-size:0.9rem" data-f="c2_connecting"></span></span>
+                    </div>
+                    <div class="stat-row">
+                        <span class="stat-label">↑↓ Traffic</span>
+                        <span class="stat-value" data-f="c2_traffic"></span>
+                    </div>
+                </div>
+            </div>
+            
+            <div class="service-section" data-f="sf_hidden">
+                <div class="service-title">❄️ Snowflake (WebRTC)</div>
+                <div class="stat-row">
+                    <span class="stat-label">Clients Served</span>
+                    <span class="stat-value" style="color:#a55eea" data-f="sf_clients"></span>
+                </div>
+                <div class="stat-row">
+                    <span class="stat-label">Uptime</span>
+                    <span class="stat-value" data-f="sf_uptime"></span>
+                </div>
+            </div>
+            
+            <div class="service-section" data-f="tor_hidden">
+                <div class="service-title">🌉 Tor Bridge (obfs4)</div>
+                <div class="stat-row">
+                    <span class="stat-label">Bootstrap</span>
+                    <span class="stat-value" data-f="tor_boot tor_boot_color"></span>
+                </div>
+                <div class="progress-bar"><div class="progress-fill cpu" data-f="tor_boot_w"></div></div>
+                <div class="stat-row" style="margin-top:8px">
+                    <span class="stat-label">Uptime</span>
+                    <span class="stat-value" data-f="tor_uptime"></span>
+                </div>
+            </div>
+            
+            <div class="stat-row" style="margin-top:12px">
+                <span class="stat-label">CPU</span>
+                <span class="stat-value" data-f="cpu"></span>
+            </div>
+            <div class="progress-bar"><div class="progress-fill cpu" data-f="cpu_w"></div></div>
+            <div class="stat-row" style="margin-top:12px">
+                <span class="stat-label">Memory</span>
+                <span class="stat-value" data-f="mem"></span>
+            </div>
+            <div class="progress-bar"><div class="progress-fill mem" data-f="mem_w"></div></div>
+            <div class="vps-footer" data-f="uptime"></div>
+        </div>
+    </template>
+    
     <script>
         const colors = ['#00d9ff', '#00ff88', '#ff6b6b', '#ffa502', '#a55eea', '#26de81', '#fd79a8', '#74b9ff'];
         let connectionsChart, currentConnChart;
-        let historyData = { data: [], vps_names: [] };
+        // Chart points ({x: ms, y: total}) for the selected range, built once
+        // per history point as it arrives instead of on every redraw
+        let historyPoints = [];
         let currentTimeRange = '24h';
+        // Latest stats snapshot; polls only fetch what changed since statsState.version
+        let statsState = null;
         
         function initCharts() {
             connectionsChart = new Chart(document.getElementById('connectionsChart'), {
@@ -759,9 +1645,21 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                     responsive: true,
                     maintainAspectRatio: false,
                     interaction: { mode: 'index', intersect: false },
+                    // Points are already {x: ms, y: total}, sorted by x and
+                    // unique, so Chart.js can skip parsing and index checks
+                    // (decimation needs that too); animating 15 s data adds
+                    // nothing
+                    parsing: false,
+                    normalized: true,
+                    spanGaps: true,
+                    animation: false,
                     plugins: {
                         legend: { display: false },
-                        tooltip: { mode: 'index', intersect: false }
+                        tooltip: { mode: 'index', intersect: false },
+                        // Streamed points pile up on top of the server's
+                        // downsampled range; past 4x the canvas width, draw an
+                        // LTTB sample of one point per pixel instead
+                        decimation: { enabled: true, algorithm: 'lttb' }
                     },
                     scales: {
                         x: {
@@ -796,15 +1694,32 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             });
         }
         
+        // The button highlight follows every click; the chart rebuild and the
+        // new stream (which resends the whole range) wait until the clicks stop
+        let rangeTimer = null;
         function setTimeRange(range) {
             currentTimeRange = range;
             document.querySelectorAll('.chart-controls button').forEach(b => b.classList.remove('active'));
             document.getElementById('btn-' + range).classList.add('active');
-            updateConnectionsChart();
+            clearTimeout(rangeTimer);
+            rangeTimer = setTimeout(() => {
+                updateConnectionsChart();
+                if (!document.hidden) openStatsStream();
+            }, 150);
         }
         
+        // Turn the ts/total columns of a history payload into chart points
+        function toPoints(h) {
+            const points = new Array(h.ts.length);
+            for (let i = 0; i < h.ts.length; i++) points[i] = { x: h.ts[i] * 1000, y: h.total[i] };
+            return points;
+        }
+        
+        // Drop the points that fell out of the selected range off the front
+        // of historyPoints (in place, so the chart's data array follows) and
+        // return what is left
         function getFilteredHistory() {
-            if (!historyData.data || historyData.data.length === 0) return [];
+            if (historyPoints.length === 0) return historyPoints;
             
             const now = new Date();
             let hoursBack = 24;
@@ -814,39 +1729,40 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             else if (currentTimeRange === '48h') hoursBack = 48;
             
             const cutoffMs = now.getTime() - (hoursBack * 60 * 60 * 1000);
-            return historyData.data.filter(d => {
-                // Parse time string like "2026-01-30 18:31:22"
-                const timeStr = d.time.replace(' ', 'T');
-                const dataTime = new Date(timeStr);
-                return dataTime.getTime() >= cutoffMs;
-            });
+            const expired = lowerBound(historyPoints, cutoffMs);
+            if (expired) historyPoints.splice(0, expired);
+            return historyPoints;
         }
         
+        // Index of the first point at or after x (points are sorted by x)
+        function lowerBound(points, x) {
+            let lo = 0, hi = points.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >>> 1;
+                if (points[mid].x < x) lo = mid + 1;
+                else hi = mid;
+            }
+            return lo;
+        }
+        
+        // Show total connections as single stacked area instead of separate
+        // lines. The dataset is kept; new points are appended to its data
+        // array rather than the chart being handed a fresh one every event.
+        const historyDataset = {
+            label: 'Total Connections',
+            data: historyPoints,
+            borderColor: '#00d9ff',
+            backgroundColor: 'rgba(0, 217, 255, 0.3)',
+            fill: true,
+            tension: 0.3,
+            pointRadius: 0,
+            borderWidth: 2
+        };
+        
         function updateConnectionsChart() {
             const filtered = getFilteredHistory();
-            if (filtered.length === 0) {
-                connectionsChart.data.datasets = [];
-                connectionsChart.update('none');
-                return;
-            }
-            
-            // Show total connections as single stacked area instead of separate lines
-            const totalData = filtered.map(d => {
-                const total = Object.values(d.connections || {}).reduce((a, b) => a + (b || 0), 0);
-                const timeStr = d.time.replace(' ', 'T');
-                return { x: new Date(timeStr), y: total };
-            });
-            
-            connectionsChart.data.datasets = [{
-                label: 'Total Connections',
-                data: totalData,
-                borderColor: '#00d9ff',
-                backgroundColor: 'rgba(0, 217, 255, 0.3)',
-                fill: true,
-                tension: 0.3,
-                pointRadius: 0,
-                borderWidth: 2
-            }];
+            historyDataset.data = filtered;
+            connectionsChart.data.datasets = filtered.length ? [historyDataset] : [];
             
             // Adjust time unit based on range
             let unit = 'hour';
@@ -857,27 +1773,53 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             connectionsChart.update('none');
         }
         
+        function sameArray(a, b) {
+            if (a.length !== b.length) return false;
+            for (let i = 0; i < a.length; i++) if (a[i] !== b[i]) return false;
+            return true;
+        }
+        
+        // Bar colours cycle through the palette; rebuilt only when the bar
+        // count changes
+        let barColorCache = [];
+        function barColors(n) {
+            if (barColorCache.length !== n) {
+                barColorCache = Array.from({ length: n }, (_, i) => colors[i % colors.length]);
+            }
+            return barColorCache;
+        }
+        
+        let lastSummaryHtml = '';
         function updateDashboard(data) {
             document.getElementById('timestamp').textContent = data.timestamp;
             
             const vps = data.vps;
             const conduits = data.conduits || [];
-            const online = vps.filter(v => v.online).length;
-            const totalConn = vps.reduce((a, v) => a + v.connections + (v.connections2 || 0), 0);
-            const totalConnecting = vps.reduce((a, v) => a + (v.connecting || 0) + (v.connecting2 || 0), 0);
-            const totalUp = vps.reduce((a, v) => a + (v.conduit_up_gb || 0) + (v.conduit2_up_gb || 0), 0);
-            const totalDown = vps.reduce((a, v) => a + (v.conduit_down_gb || 0) + (v.conduit2_down_gb || 0), 0);
-            const avgCpu = vps.length ? (vps.reduce((a, v) => a + v.cpu_percent, 0) / vps.length) : 0;
+            const totalConduits = conduits.length;
             
-            // Count services
-            const conduit1Up = vps.filter(v => v.conduit_running).length;
-            const conduit2Up = vps.filter(v => v.conduit2_running).length;
-            const totalConduits = conduit1Up + conduit2Up;
-            const snowflakeUp = vps.filter(v => v.snowflake_running).length;
-            const torbridgeUp = vps.filter(v => v.torbridge_running).length;
-            const totalSnowflakeClients = vps.reduce((a, v) => a + (v.snowflake_clients || 0), 0);
+            // One pass over each list for all the totals. Stopped conduits
+            // report zeros, so the running list covers the conduit totals.
+            let totalConn = 0, totalConnecting = 0, totalUp = 0, totalDown = 0;
+            let conduit1Up = 0, conduit2Up = 0;
+            for (const c of conduits) {
+                totalConn += c.connections;
+                totalConnecting += c.connecting;
+                totalUp += c.up_gb;
+                totalDown += c.down_gb;
+                if (c.instance === 1) conduit1Up++;
+                else if (c.instance === 2) conduit2Up++;
+            }
+            let online = 0, cpuSum = 0, snowflakeUp = 0, torbridgeUp = 0, totalSnowflakeClients = 0;
+            for (const v of vps) {
+                if (v.online) online++;
+                cpuSum += v.cpu_percent;
+                if (v.snowflake_running) snowflakeUp++;
+                if (v.torbridge_running) torbridgeUp++;
+                totalSnowflakeClients += v.snowflake_clients || 0;
+            }
+            const avgCpu = vps.length ? cpuSum / vps.length : 0;
             
-            document.getElementById('summary').innerHTML = `
+            const summaryHtml = `
                 <div class="summary-card"><div class="summary-icon">🖥️</div><div class="summary-value">${online}/${vps.length}</div><div class="summary-label">VPS Online</div></div>
                 <div class="summary-card"><div class="summary-icon">🚀</div><div class="summary-value" style="color:#00d9ff">${totalConduits}</div><div class="summary-label">Conduits (${conduit1Up}+${conduit2Up})</div></div>
                 <div class="summary-card"><div class="summary-icon">❄️</div><div class="summary-value" style="color:#a55eea">${snowflakeUp}</div><div class="summary-label">Snowflake</div></div>
@@ -887,195 +1829,461 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 <div class="summary-card"><div class="summary-icon">📤</div><div class="summary-value">${totalUp.toFixed(1)}</div><div class="summary-label">Upload (GB)</div></div>
                 <div class="summary-card"><div class="summary-icon">📥</div><div class="summary-value">${totalDown.toFixed(1)}</div><div class="summary-label">Download (GB)</div></div>
             `;
+            if (summaryHtml !== lastSummaryHtml) {
+                document.getElementById('summary').innerHTML = summaryHtml;
+                lastSummaryHtml = summaryHtml;
+            }
             
-            // Update current connections bar chart - show all conduits
+            // Update current connections bar chart - show all conduits;
+            // Chart.js is left alone when no bar changed
             const conduitLabels = conduits.map(c => c.name);
             const conduitConns = conduits.map(c => c.connections);
-            currentConnChart.data.labels = conduitLabels;
-            currentConnChart.data.datasets[0].data = conduitConns;
-            currentConnChart.data.datasets[0].backgroundColor = conduits.map((c, i) => colors[i % colors.length]);
-            currentConnChart.update('none');
+            const bars = currentConnChart.data;
+            if (!sameArray(bars.labels, conduitLabels) || !sameArray(bars.datasets[0].data, conduitConns)) {
+                bars.labels = conduitLabels;
+                bars.datasets[0].data = conduitConns;
+                bars.datasets[0].backgroundColor = barColors(conduits.length);
+                currentConnChart.update('none');
+            }
             
             // Update conduit count in chart title
             document.getElementById('conduitCount').textContent = conduits.length;
             
-            // VPS cards - mask IPs for security
-            function maskIP(ip) {
+            updateVpsGrid(vps, data.dirty);
+        }
+        
+        // VPS cards - mask IPs for security. The server sends ip_masked; this
+        // is the fallback, memoized since the same few IPs come back forever.
+        const maskedIPs = new Map();
+        function maskIP(ip) {
+            let masked = maskedIPs.get(ip);
+            if (masked === undefined) {
                 const parts = ip.split('.');
-                if (parts.length === 4) return parts[0] + '.' + parts[1] + '.***.***';
-                return '***.***.***.***';
+                masked = parts.length === 4 ? parts[0] + '.' + parts[1] + '.***.***' : '***.***.***.***';
+                maskedIPs.set(ip, masked);
             }
-            document.getElementById('vpsGrid').innerHTML = vps.map(v => `
-                <div class="vps-card ${v.online ? 'online' : 'offline'}">
-                    <div class="vps-header">
-                        <span class="vps-name">${v.alias}</span>
-                        <span class="vps-status">${v.online ? '🟢 Online' : '🔴 Offline'}</span>
-                    </div>
-                    <div class="vps-ip">${maskIP(v.ip)}</div>
-                    
-                    <div class="services-row">
-                        <span class="service-badge ${v.conduit_running ? 'running' : 'stopped'}">
-                            <span class="dot"></span>C1
-                        </span>
-                        <span class="service-badge ${v.conduit2_running ? 'running' : 'stopped'}">
-                            <span class="dot"></span>C2
-                        </span>
-                        <span class="service-badge ${v.snowflake_running ? 'running' : 'stopped'}">
-                            <span class="dot"></span>SF
-                        </span>
-                        <span class="service-badge ${v.torbridge_running ? 'running' : 'stopped'}">
-                            <span class="dot"></span>Tor
-                        </span>
-                    </div>
-                    
-                    ${v.conduit_running || v.conduit2_running ? `
-                    <div class="service-section">
-                        <div class="service-title">🚀 Conduit Instances</div>
-                        ${v.conduit_running ? `
-                        <div style="margin-bottom:8px;padding:8px;background:rgba(0,217,255,0.1);border-radius:6px;">
-                            <div style="font-size:0.75rem;color:#00d9ff;margin-bottom:4px;">C1 (${v.conduit_uptime})</div>
-                            <div class="stat-row">
-                                <span class="stat-label">Connected / Connecting</span>
-                                <span class="stat-value highlight">${v.connections} <span style="color:#ffa502;font-size:0.9rem">/ ${v.connecting || 0}</span></span>
-                            </div>
-                            <div class="stat-row">
-                                <span class="stat-label">↑↓ Traffic</span>
-                                <span class="stat-value">${v.conduit_up || 'N/A'} / ${v.conduit_down || 'N/A'}</span>
-                            </div>
-                        </div>
-                        ` : ''}
-                        ${v.conduit2_running ? `
-                        <div style="padding:8px;background:rgba(0,255,136,0.1);border-radius:6px;">
-                            <div style="font-size:0.75rem;color:#00ff88;margin-bottom:4px;">C2 (${v.conduit2_uptime})</div>
-                            <div class="stat-row">
-                                <span class="stat-label">Connected / Connecting</span>
-                                <span class="stat-value highlight">${v.connections2 || 0} <span style="color:#ffa502;font-size:0.9rem">/ ${v.connecting2 || 0}</span></span>
-                            </div>
-                            <div class="stat-row">
-                                <span class="stat-label">↑↓ Traffic</span>
-                                <span class="stat-value">${v.conduit2_up || 'N/A'} / ${v.conduit2_down || 'N/A'}</span>
-                            </div>
-                        </div>
-                        ` : ''}
-                    </div>
-                    ` : ''}
-                    
-                    ${v.snowflake_running ? `
-                    <div class="service-section">
-                        <div class="service-title">❄️ Snowflake (WebRTC)</div>
-                        <div class="stat-row">
-                            <span class="stat-label">Clients Served</span>
-                            <span class="stat-value" style="color:#a55eea">${v.snowflake_clients || 0}</span>
-                        </div>
-                        <div class="stat-row">
-                            <span class="stat-label">Uptime</span>
-                            <span class="stat-value">${v.snowflake_uptime || 'N/A'}</span>
-                        </div>
-                    </div>
-                    ` : ''}
-                    
-                    ${v.torbridge_running ? `
-                    <div class="service-section">
-                        <div class="service-title">🌉 Tor Bridge (obfs4)</div>
-                        <div class="stat-row">
-                            <span class="stat-label">Bootstrap</span>
-                            <span class="stat-value" style="color:${v.torbridge_bootstrap >= 100 ? '#00ff88' : '#ffa502'}">${v.torbridge_bootstrap}%</span>
-                        </div>
-                        <div class="progress-bar"><div class="progress-fill cpu" style="width:${v.torbridge_bootstrap}%"></div></div>
-                        <div class="stat-row" style="margin-top:8px">
-                            <span class="stat-label">Uptime</span>
-                            <span class="stat-value">${v.torbridge_uptime || 'N/A'}</span>
-                        </div>
-                    </div>
-                    ` : ''}
+            return masked;
+        }
+        
+        // Everything on a card, by data-f slot. Slots ending in _w set a
+        // width, _color a colour, _class the class list, _hidden whether the
+        // element is shown; the rest set their text.
+        function cardValues(v) {
+            const [c1, c2] = v.conduits;
+            const boot = v.torbridge_bootstrap;
+            const badge = running => running ? 'service-badge running' : 'service-badge stopped';
+            return {
+                card_class: v.online ? 'vps-card online' : 'vps-card offline',
+                alias: v.alias,
+                status: v.online ? '🟢 Online' : '🔴 Offline',
+                ip: v.ip_masked || maskIP(v.ip),
+                c1_badge_class: badge(c1.running),
+                c2_badge_class: badge(c2.running),
+                sf_badge_class: badge(v.snowflake_running),
+                tor_badge_class: badge(v.torbridge_running),
+                conduits_hidden: !(c1.running || c2.running),
+                c1_hidden: !c1.running,
+                c1_uptime: `C1 (${c1.uptime})`,
+                c1_conn: c1.connections,
+                c1_connecting: `/ ${c1.connecting}`,
+                c1_traffic: `${c1.up} / ${c1.down}`,
+                c2_hidden: !c2.running,
+                c2_uptime: `C2 (${c2.uptime})`,
+                c2_conn: c2.connections,
+                c2_connecting: `/ ${c2.connecting}`,
+                c2_traffic: `${c2.up} / ${c2.down}`,
+                sf_hidden: !v.snowflake_running,
+                sf_clients: v.snowflake_clients || 0,
+                sf_uptime: v.snowflake_uptime || 'N/A',
+                tor_hidden: !v.torbridge_running,
+                tor_boot: `${boot}%`,
+                tor_boot_color: boot >= 100 ? '#00ff88' : '#ffa502',
+                tor_boot_w: `${boot}%`,
+                tor_uptime: v.torbridge_uptime || 'N/A',
+                cpu: `${v.cpu_percent.toFixed(1)}%`,
+                cpu_w: `${Math.min(v.cpu_percent, 100)}%`,
+                mem: `${v.memory_mb.toFixed(0)} MB`,
+                mem_w: `${Math.min(v.memory_percent, 100)}%`,
+                uptime: `Server Uptime: ${v.uptime}`
+            };
+        }
+        
+        // Write the values that changed since the last update into the card's
+        // slot elements; nothing is parsed
+        function patchCard(card, values) {
+            for (const name in values) {
+                const value = values[name];
+                if (card.values[name] === value) continue;
+                const el = card.slots.get(name);
+                if (name.endsWith('_w')) el.style.width = value;
+                else if (name.endsWith('_color')) el.style.color = value;
+                else if (name.endsWith('_class')) el.className = value;
+                else if (name.endsWith('_hidden')) el.hidden = value;
+                else el.textContent = value;
+            }
+            card.values = values;
+        }
+        
+        // Cards by alias. A card is cloned from #tpl-vps-card the first time
+        // its VPS shows up; after that every update, including services
+        // starting or stopping, only patches its slots. `dirty` is the set of
+        // aliases a delta touched (null after a full snapshot): other cards
+        // are not even looked at.
+        const vpsCards = new Map();
+        const cardTemplate = document.getElementById('tpl-vps-card').content.firstElementChild;
+        
+        function buildCard() {
+            const el = cardTemplate.cloneNode(true);
+            const slots = new Map();
+            el.querySelectorAll('[data-f]').forEach(s => s.dataset.f.split(' ').forEach(n => slots.set(n, s)));
+            slots.set('card_class', el);
+            return { el, values: {}, slots };
+        }
+        
+        function updateVpsGrid(vps, dirty) {
+            const grid = document.getElementById('vpsGrid');
+            const seen = new Set();
+            let prev = null;
+            vps.forEach(v => {
+                seen.add(v.alias);
+                let card = vpsCards.get(v.alias);
+                const fresh = !card;
+                if (fresh) {
+                    card = buildCard();
+                    vpsCards.set(v.alias, card);
+                }
+                if (fresh || !dirty || dirty.has(v.alias)) patchCard(card, cardValues(v));
+                const next = prev ? prev.nextElementSibling : grid.firstElementChild;
+                if (next !== card.el) grid.insertBefore(card.el, next);
+                prev = card.el;
+            });
+            vpsCards.forEach((card, alias) => {
+                if (!seen.has(alias)) {
+                    card.el.remove();
+                    vpsCards.delete(alias);
+                }
+            });
+        }
+        
+        // Merge a full snapshot or a delta from /api/stats into statsState
+        function applyStats(data) {
+            let dirty = null;
+            if (data.base === undefined) {
+                statsState = {
+                    version: data.version,
+                    timestamp: data.timestamp,
+                    conduits: data.conduits,
+                    vps: new Map(data.vps.map(v => [v.alias, v]))
+                };
+            } else {
+                statsState.version = data.version;
+                if (data.timestamp !== undefined) statsState.timestamp = data.timestamp;
+                if (data.conduits !== undefined) statsState.conduits = data.conduits;
+                (data.removed || []).forEach(alias => statsState.vps.delete(alias));
+                (data.added || []).forEach(v => statsState.vps.set(v.alias, v));
+                (data.changed || []).forEach(c => Object.assign(statsState.vps.get(c.alias), c.fields));
+                dirty = new Set([...(data.added || []).map(v => v.alias), ...(data.changed || []).map(c => c.alias)]);
+            }
+            const vps = [...statsState.vps.values()].sort((a, b) => a.alias < b.alias ? -1 : a.alias > b.alias ? 1 : 0);
+            return { timestamp: statsState.timestamp, conduits: statsState.conduits, vps, dirty };
+        }
+        
+        // The server pushes a snapshot (stats plus history for the selected
+        // range) after every collection; a new range means a new stream.
+        // EventSource reconnects by itself. The first event carries the full
+        // history range, and full stats unless the server can send a delta
+        // from the version we hold (?since= here, Last-Event-ID on reconnect).
+        let statsStream = null;
+        function openStatsStream() {
+            if (statsStream) statsStream.close();
+            const since = statsState ? '&since=' + statsState.version : '';
+            statsStream = new EventSource('/api/stream?range=' + currentTimeRange + since);
+            statsStream.onmessage = (e) => {
+                try {
+                    const snap = JSON.parse(e.data);
+                    const statsData = applyStats(snap.stats);
+                    const h = snap.history;
+                    if (h.since === undefined) {
+                        historyPoints = toPoints(h);
+                    } else {
+                        // Only the points after the last event; getFilteredHistory
+                        // drops the expired ones off the front
+                        historyPoints.push(...toPoints(h));
+                    }
                     
-                    <div class="stat-row" style="margin-top:12px">
-                        <span class="stat-label">CPU</span>
-                        <span class="stat-value">${v.cpu_percent.toFixed(1)}%</span>
-                    </div>
-                    <div class="progress-bar"><div class="progress-fill cpu" style="width:${Math.min(v.cpu_percent,100)}%"></div></div>
-                    <div class="stat-row" style="margin-top:12px">
-                        <span class="stat-label">Memory</span>
-                        <span class="stat-value">${v.memory_mb.toFixed(0)} MB</span>
-                    </div>
-                    <div class="progress-bar"><div class="progress-fill mem" style="width:${Math.min(v.memory_percent,100)}%"></div></div>
-                    <div class="vps-footer">Server Uptime: ${v.uptime}</div>
-                </div>
-            `).join('');
+                    scheduleFlush(statsData);
+                } catch (err) {
+                    console.error('Failed to apply stats:', err);
+                }
+            };
         }
         
-        async function fetchStats() {
-            try {
-                const [statsRes, historyRes] = await Promise.all([
-                    fetch('/api/stats'),
-                    fetch('/api/history')
-                ]);
-                const statsData = await statsRes.json();
-                historyData = await historyRes.json();
-                
-                updateDashboard(statsData);
-                updateConnectionsChart();
-            } catch (e) {
-                console.error('Failed to fetch stats:', e);
+        // Render at most once per frame: events that arrive before the next
+        // frame only leave their stats behind, and the DOM and both charts
+        // are updated once with the latest. Cards touched by any of them are
+        // re-rendered (a full snapshot among them means all of them).
+        let pendingFlush = null;
+        let nextStats = null;
+        function scheduleFlush(statsData) {
+            if (nextStats && nextStats.dirty && statsData.dirty) {
+                nextStats.dirty.forEach(alias => statsData.dirty.add(alias));
+            } else if (nextStats) {
+                statsData.dirty = null;
             }
+            nextStats = statsData;
+            if (pendingFlush) return;
+            pendingFlush = requestAnimationFrame(() => {
+                pendingFlush = null;
+                const data = nextStats;
+                nextStats = null;
+                try {
+                    updateDashboard(data);
+                    updateConnectionsChart();
+                } catch (err) {
+                    console.error('Failed to render stats:', err);
+                }
+            });
         }
         
+        // Background tabs drop the stream and reopen it (resuming from the stats
+        // version they hold) when shown again, so hidden dashboards cost nothing
+        document.addEventListener('visibilitychange', () => {
+            if (document.hidden) {
+                if (statsStream) statsStream.close();
+                statsStream = null;
+            } else {
+                openStatsStream();
+            }
+        });
+        
         initCharts();
-        fetchStats();
-        setInterval(fetchStats, 5000);
+        if (!document.hidden) openStatsStream();
     </script>
 </body>
 </html>'''
 
+# The page never changes at runtime, so encode and compress it once. Leading
+# indentation and blank lines are dropped; line breaks stay so the inline
+# script still parses the same way.
+HTML_BYTES = "\n".join(
+    line.strip() for line in HTML_TEMPLATE.splitlines() if line.strip()
+).encode()
+HTML_GZ = gzip.compress(HTML_BYTES, 9)
+HTML_BR = brotli.compress(HTML_BYTES, quality=11) if brotli else None
+HTML_ETAG = '"' + hashlib.md5(HTML_BYTES).hexdigest() + '"'
+
 
 # Load logo image at startup
 LOGO_FILE = SCRIPT_DIR / "lionandsun.jpeg"
 LOGO_DATA = None
+LOGO_ETAG = None
 if LOGO_FILE.exists():
     with open(LOGO_FILE, "rb") as f:
         LOGO_DATA = f.read()
+    LOGO_ETAG = '"' + hashlib.md5(LOGO_DATA).hexdigest() + '"'
+
+
+class DashboardServer(ThreadingHTTPServer):
+    """One daemon thread per connection, with a deeper listen backlog."""
+    # The default backlog of 5 can refuse connections when several tabs
+    # reload at once; threads are cheap next to that
+    request_queue_size = 64
+
+    def get_request(self):
+        conn, addr = super().get_request()
+        # Responses are written in one go (see DashboardHandler.wbufsize), so
+        # Nagle only adds delay, e.g. to event stream pushes
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn, addr
 
 
 class DashboardHandler(BaseHTTPRequestHandler):
+    # Buffer writes so headers and body leave in one send; the base class
+    # flushes after every request
+    wbufsize = 64 * 1024
+    # Keep-alive: polls reuse one connection. Every response carries a
+    # Content-Length (or closes the connection); idle connections are
+    # dropped after `timeout` seconds.
+    protocol_version = 'HTTP/1.1'
+    timeout = 60
+
+    def log_request(self, code='-', size='-'):
+        pass  # Skip formatting the access line at all
+
     def log_message(self, format, *args):
         pass  # Suppress HTTP logs
     
+    def accepts_encoding(self, coding):
+        """True if Accept-Encoding lists coding without refusing it via q=0."""
+        for entry in self.headers.get('Accept-Encoding', '').split(','):
+            name, *params = entry.split(';')
+            if name.strip().lower() != coding:
+                continue
+            for param in params:
+                key, _, value = param.partition('=')
+                if key.strip().lower() == 'q':
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+        return False
+
+    def etag_matches(self, etag):
+        """True if If-None-Match lists etag (weak tags from proxies count too)."""
+        for tag in self.headers.get('If-None-Match', '').split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag in (etag, '*'):
+                return True
+        return False
+
+    def not_modified_since(self, last_modified):
+        """
+        True if If-Modified-Since is at or after epoch second last_modified.
+        Only consulted without If-None-Match, which takes precedence.
+        """
+        since = self.headers.get('If-Modified-Since')
+        if not last_modified or not since or 'If-None-Match' in self.headers:
+            return False
+        try:
+            return parsedate_to_datetime(since).timestamp() >= last_modified
+        except (TypeError, ValueError):
+            return False
+
+    def send_not_modified(self, etag):
+        """304 for a client whose If-None-Match already lists etag."""
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+    def send_payload(self, payload, content_type):
+        """Send a pre-encoded payload (see encode_payload), honouring ETag, br and gzip."""
+        last_modified = payload.get("last_modified")
+        if self.etag_matches(payload["etag"]) or self.not_modified_since(last_modified):
+            self.send_not_modified(payload["etag"])
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        # Revalidate on every poll; unchanged payloads then cost a 304
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('ETag', payload["etag"])
+        if last_modified:
+            self.send_header('Last-Modified', formatdate(last_modified, usegmt=True))
+        self.send_header('Vary', 'Accept-Encoding')
+        body = payload["body"]
+        if payload["br"] and self.accepts_encoding('br'):
+            body = payload["br"]
+            self.send_header('Content-Encoding', 'br')
+        elif self.accepts_encoding('gzip'):
+            body = payload["gzip"]
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_snapshots(self, range_key, since=''):
+        """
+        Server-Sent Events: push a snapshot each time the collector publishes.
+        Each event's id is its stats version, so a reconnecting EventSource
+        (Last-Event-ID) or a reopened stream (?since=) starts with a delta.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')  # no length: the stream ends with the connection
+        self.end_headers()
+        self.wfile.flush()
+        # Events go straight to the socket, so nothing is left in the write
+        # buffer when the client disconnects
+        # First event is a full snapshot unless the client still holds a
+        # recent version, then deltas
+        since = self.headers.get('Last-Event-ID') or since
+        # History likewise: the whole range, then only the new points, with
+        # a full (freshly downsampled) range again every STREAM_HISTORY_RESYNC
+        history_since = None
+        events = 0
+        try:
+            while True:
+                current = stats_payload
+                payload = get_snapshot_payload(since, range_key, current, history_since)
+                since = str(current["version"])
+                self.connection.sendall(b"id: " + since.encode() + b"\ndata: " + payload["body"] + b"\n\n")
+                events += 1
+                history_since = payload["last_ts"] if events % STREAM_HISTORY_RESYNC else None
+                while True:
+                    with stats_changed:
+                        fresh = stats_changed.wait_for(lambda: stats_payload is not current, STREAM_KEEPALIVE)
+                    if fresh:
+                        break
+                    # Keeps proxies from timing out and notices closed tabs
+                    self.connection.sendall(b": keepalive\n\n")
+        except OSError:
+            pass  # client went away
+
     def do_HEAD(self):
         """Handle HEAD requests (used by health checks)."""
         self.send_response(200)
         self.send_header('Content-Type', 'text/html')
+        self.send_header('ETag', HTML_ETAG)
+        self.send_header('Content-Length', str(len(HTML_BYTES)))
         self.end_headers()
     
     def do_GET(self):
-        if self.path == '/api/stats':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            with stats_lock:
-                self.wfile.write(json.dumps(current_stats).encode())
-        elif self.path == '/api/history':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            history = load_history()
-            self.wfile.write(json.dumps(history).encode())
-        elif self.path == '/logo.jpeg':
-            if LOGO_DATA:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/api/stats':
+            # ?since=<version>: only what changed since that snapshot
+            variant = get_stats_variant(query.get('since', [''])[0])
+            self.send_payload(variant, 'application/json')
+        elif url.path == '/api/snapshot':
+            # One poll for both: ?since=<stats version>&range=<chart range>
+            payload = get_snapshot_payload(query.get('since', [''])[0], query.get('range', [''])[0])
+            self.send_payload(payload, 'application/json')
+        elif url.path == '/api/stream':
+            self.stream_snapshots(query.get('range', [''])[0], query.get('since', [''])[0])
+        elif url.path == '/api/history':
+            # ?since=<ts>: only the points after the newest one the client has
+            since = query.get('since', [''])[0]
+            since = int(since) if since.isdigit() else None
+            payload = get_history_payload(query.get('range', [''])[0], since)
+            self.send_payload(payload, 'application/json')
+        elif url.path == '/logo.jpeg':
+            if LOGO_DATA and self.etag_matches(LOGO_ETAG):
+                self.send_not_modified(LOGO_ETAG)
+            elif LOGO_DATA:
                 self.send_response(200)
                 self.send_header('Content-Type', 'image/jpeg')
                 self.send_header('Cache-Control', 'max-age=86400')
+                self.send_header('ETag', LOGO_ETAG)
+                self.send_header('Content-Length', str(len(LOGO_DATA)))
                 self.end_headers()
                 self.wfile.write(LOGO_DATA)
             else:
                 self.send_response(404)
+                self.send_header('Content-Length', '0')
                 self.end_headers()
+        elif self.etag_matches(HTML_ETAG):
+            self.send_not_modified(HTML_ETAG)
         else:
             self.send_response(200)
             self.send_header('Content-Type', 'text/html')
+            # Revalidate each load; an unchanged page then costs a 304
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('ETag', HTML_ETAG)
+            self.send_header('Vary', 'Accept-Encoding')
+            body = HTML_BYTES
+            if HTML_BR and self.accepts_encoding('br'):
+                body = HTML_BR
+                self.send_header('Content-Encoding', 'br')
+            elif self.accepts_encoding('gzip'):
+                body = HTML_GZ
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(HTML_TEMPLATE.encode())
+            self.wfile.write(body)
 
 
 def main():
@@ -1087,9 +2295,16 @@ def main():
     print(f"📁 History file: {HISTORY_FILE}")
     print(f"📅 Keeping {HISTORY_DAYS} days of connection history")
     print()
+    load_history()
+    load_docker_prefixes()
+    load_snowflake_totals()
+    # Only after the load: a save before it would overwrite the file with
+    # the (still empty) in-memory totals
+    atexit.register(save_snowflake_totals, force=True)
     
-    # Start HTTP server first (non-blocking)
-    server = HTTPServer(('0.0.0.0', PORT), DashboardHandler)
+    # Start HTTP server first (non-blocking). One daemon thread per
+    # connection, so a slow client can't hold up the other tabs.
+    server = DashboardServer(('0.0.0.0', PORT), DashboardHandler)
     print(f"✅ Dashboard running at: http://localhost:{PORT}")
     print(f"   Auto-refresh every {REFRESH_INTERVAL} seconds")
     print()